@@ -0,0 +1,198 @@
+"""
+Regression checks of the indexes and formats the hot paths rely on: every check compares a fast path with the plain
+computation it stands for, or a format read back with what was written, on seeded random data. None of them need
+arcade, so they run anywhere the benchmarks do.
+
+Run from the repository root: python -m benchmarks.checks [--filter NAME]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+from default_stages import DEFAULT_STAGES_PATH
+from litter_grid import LitterGrid
+from network import BOAT_PREFIX, LITTER_PREFIX, apply_delta, decode_message, encode_delta, encode_message, \
+    quantize_litter
+from physics import BoatForces
+from stage_loader import StagePack, _build_stage, _parse_stage, _read_pack
+from telemetry import EVENT_COLUMNS, TICK_COLUMNS, TelemetryReader, TelemetryRecorder
+from telemetry_events import EVENT_KINDS
+
+SEED = 0
+
+CHECKS = {}
+
+
+def check(name):
+    """
+    Registers a check, which raises AssertionError on a mismatch.
+    """
+    def register(function):
+        CHECKS[name] = function
+        return function
+    return register
+
+
+@check("litter_grid_queries")
+def _litter_grid_queries():
+    rng = random.Random(SEED)
+    grid = LitterGrid(cell_size=130)
+    litters = {}
+
+    def check_arrays():
+        # The arrays are cached, so they are read after every kind of change to catch a missed invalidation
+        ids, xs, ys = grid.as_arrays()
+        assert dict(zip(ids.tolist(), zip(xs.tolist(), ys.tolist()))) == litters, "as_arrays is stale"
+
+    for _ in range(20):
+        for _ in range(50):
+            x, y = rng.uniform(-500, 3000), rng.uniform(-500, 2000)
+            litters[grid.add(x, y)] = (x, y)
+        check_arrays()
+        for litter_id in rng.sample(sorted(litters), 20):
+            grid.remove(litter_id)
+            del litters[litter_id]
+        check_arrays()
+
+        x, y, radius = rng.uniform(-500, 3000), rng.uniform(-500, 2000), rng.uniform(0, 600)
+        expected = {litter_id for litter_id, litter in litters.items() if math.dist(litter, (x, y)) < radius}
+        assert set(grid.query_radius(x, y, radius)) == expected, "query_radius differs from brute force"
+
+        left, bottom = rng.uniform(-500, 3000), rng.uniform(-500, 2000)
+        right, top = left + rng.uniform(0, 1500), bottom + rng.uniform(0, 1000)
+        expected = {litter_id: litter for litter_id, litter in litters.items()
+                    if left < litter[0] < right and bottom < litter[1] < top}
+        assert dict(grid.query_rect(left, bottom, right, top)) == expected, "query_rect differs from brute force"
+    grid.clear()
+    litters.clear()
+    assert len(grid) == 0, "clear left litter behind"
+    check_arrays()
+
+
+@check("network_delta_round_trip")
+def _network_delta_round_trip():
+    rng = random.Random(SEED)
+    sent = {}
+    received = {}
+    next_litter = 0
+    for _ in range(300):
+        current = dict(sent)
+        for key in rng.sample(sorted(current), min(len(current), rng.randrange(4))):
+            del current[key]
+        for _ in range(rng.randrange(4)):
+            current[BOAT_PREFIX + str(rng.randrange(10))] = tuple(rng.randrange(-1 << 20, 1 << 20) for _ in range(5))
+            current[LITTER_PREFIX + str(next_litter)] = quantize_litter(rng.uniform(0, 5000), rng.uniform(0, 3000))
+            next_litter += 1
+        for key in [key for key in current if key.startswith(BOAT_PREFIX) and rng.random() < 0.5]:
+            current[key] = tuple(value + rng.randrange(-3, 4) for value in current[key])
+
+        delta = encode_delta(sent, current)
+        changed = {key for key, values in current.items() if key in sent and sent[key] != values}
+        assert set(delta.get("changed", {})) == changed, "the delta holds entities that did not change"
+        # Through the wire format too, where json turns the tuples into lists
+        received = apply_delta(received, decode_message(encode_message(delta)))
+        assert received == current, "applying the delta does not give the state it was encoded for"
+        sent = current
+
+
+def _plain(value):
+    """
+    :return: the value with the objects in it turned into dicts of their attributes, to compare them by value
+    """
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {name: _plain(item) for name, item in value.items()}
+    if hasattr(value, "__dict__") and not callable(value):
+        return _plain(vars(value))
+    return value
+
+
+@check("stage_pack_cache")
+def _stage_pack_cache():
+    pack = _read_pack(DEFAULT_STAGES_PATH)
+    expected = [_plain(_build_stage(_parse_stage(spec, pack.get("right_to_left", False)))) for spec in pack["stages"]]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # The first pack writes the cache, the second only reads it
+        for _ in range(2):
+            stages = StagePack(DEFAULT_STAGES_PATH, cache_dir)
+            assert len(stages) == len(expected), "the cache holds a different number of stages"
+            # Read out of order, as every stage is read from its own offset
+            for index in reversed(range(len(stages))):
+                assert _plain(stages[index]) == expected[index], "stage {} differs from the pack".format(index + 1)
+
+
+@check("telemetry_round_trip")
+def _telemetry_round_trip():
+    rng = np.random.default_rng(SEED)
+    # Several chunks and a partial last one, in rings large enough that the writer never has to drop rows
+    ticks = rng.normal(size=(3000, len(TICK_COLUMNS))) * 1000
+    events = rng.normal(size=(300, len(EVENT_COLUMNS))) * 1000
+    events[:, 1] = rng.integers(len(EVENT_KINDS), size=len(events))
+    events[::3, 3:] = math.nan
+    forces = BoatForces()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "session.ptlm")
+        recorder = TelemetryRecorder(path, {"seed": SEED}, capacity=4096, chunk_rows=256, event_chunk_rows=64)
+        for row in ticks:
+            for name, value in zip(TICK_COLUMNS[12:], row[12:]):
+                setattr(forces, name, value)
+            recorder.record_tick(*row[:12], forces)
+        for event_time, kind, subject_id, x, y in events:
+            recorder.record_event(int(kind), event_time, subject_id, x, y)
+        recorder.close()
+        assert recorder.dropped_ticks == 0, "the recorder dropped ticks"
+
+        with TelemetryReader(path) as reader:
+            assert reader.metadata == {"seed": SEED}, "the metadata differs"
+            read_ticks = reader.ticks()
+            read_events = reader.events()
+        for index, name in enumerate(TICK_COLUMNS):
+            assert np.array_equal(read_ticks[name], ticks[:, index]), "tick column {} differs".format(name)
+        for index, name in enumerate(EVENT_COLUMNS):
+            assert np.array_equal(read_events[name], events[:, index], equal_nan=True), \
+                "event column {} differs".format(name)
+
+        # A session cut short mid chunk reads as the chunks before it
+        with open(path, "rb") as telemetry_file:
+            data = telemetry_file.read()
+        with open(path, "wb") as telemetry_file:
+            telemetry_file.write(data[:len(data) * 2 // 3])
+        with TelemetryReader(path) as reader:
+            read_times = reader.ticks(["time"])["time"]
+        assert 0 < len(read_times) < len(ticks), "a cut file reads all or none of the ticks"
+        assert np.array_equal(read_times, ticks[:len(read_times), 0]), "a cut file reads other ticks"
+
+
+def run(names):
+    failures = 0
+    for name in names:
+        start = time.perf_counter()
+        try:
+            CHECKS[name]()
+        except Exception:
+            # A corrupted format may fail to decode at all, which fails the check like a mismatch does
+            failures += 1
+            print("{:32} FAILED".format(name))
+            traceback.print_exc()
+            continue
+        print("{:32} ok {:8.1f} ms".format(name, (time.perf_counter() - start) * 1000))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default="", help="only run the checks with this in their name")
+    args = parser.parse_args()
+    return 1 if run([name for name in CHECKS if args.filter in name]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""
+Accuracy and speed of PolarTable against the analytic drag_coef / lift_coef.
+Run from the repository root: python -m benchmarks.polar_table
+"""
+import math
+import timeit
+
+import numpy as np
+
+from sail_force import PolarTable, drag_coef, lift_coef
+
+RESOLUTIONS = [64, 256, 1024, 4096]
+ARRAY_SIZE = 100000
+REPEATS = 20
+
+
+def main():
+    angles = np.random.default_rng(0).uniform(0, math.pi, ARRAY_SIZE)
+    scalar_angle = float(angles[0])
+    analytic_drag, analytic_lift = drag_coef(angles), lift_coef(angles)
+
+    analytic_array_time = timeit.timeit(lambda: (drag_coef(angles), lift_coef(angles)), number=REPEATS) / REPEATS
+    analytic_scalar_time = timeit.timeit(lambda: (drag_coef(scalar_angle), lift_coef(scalar_angle)),
+                                         number=ARRAY_SIZE) / ARRAY_SIZE
+    print("analytic: array {:.3f} ms per {} angles, scalar {:.3f} us".format(analytic_array_time * 1e3, ARRAY_SIZE,
+                                                                              analytic_scalar_time * 1e6))
+
+    for resolution in RESOLUTIONS:
+        table = PolarTable(resolution=resolution)
+        table_drag, table_lift = table.coefs(angles)
+        max_error = max(np.abs(table_drag - analytic_drag).max(), np.abs(table_lift - analytic_lift).max())
+        array_time = timeit.timeit(lambda: table.coefs(angles), number=REPEATS) / REPEATS
+        scalar_time = timeit.timeit(lambda: table.scalar_coefs(scalar_angle), number=ARRAY_SIZE) / ARRAY_SIZE
+        print("table {:5}: max error {:.2e}, array {:.3f} ms ({:.1f}x), scalar {:.3f} us ({:.1f}x)".format(
+            resolution, max_error, array_time * 1e3, analytic_array_time / array_time, scalar_time * 1e6,
+            analytic_scalar_time / scalar_time))
+
+
+if __name__ == "__main__":
+    main()
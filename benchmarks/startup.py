@@ -0,0 +1,114 @@
+"""
+Cold start times: how long every module takes to import in a fresh interpreter and what its largest imports are,
+and how long it takes from launching the game to its first intro frame, against a time budget. Also checks that the
+game logic modules import without the graphics stack, so they can be scripted headlessly.
+The intro is timed in a hidden window, and skipped when arcade is not available.
+
+Run from the repository root: python -m benchmarks.startup [--budget SECONDS]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEADLESS_MODULES = ["sail_force", "physics", "vpp", "stage", "stage_loader", "default_stages", "game", "planner",
+                    "controllers", "replay", "telemetry_events", "telemetry", "server"]
+GRAPHICS_MODULES = ["arcade", "pyglet"]
+LARGEST_IMPORTS_SHOWN = 4
+INTRO_TIME_BUDGET = 2
+RUNS = 5
+
+_INTRO_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+window = main.create_game(visible=False)
+opened = time.perf_counter()
+window.on_draw()
+window.ctx.finish()
+drawn = time.perf_counter()
+print(json.dumps({"imports": imported - start, "window": opened - imported, "first_frame": drawn - opened}),
+      flush=True)
+"""
+
+
+def _python(*args):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True)
+
+
+def import_breakdown(module):
+    """
+    :return: seconds to import the module in a fresh interpreter, (name, seconds) of its largest direct imports,
+    and the graphics modules it loaded
+    """
+    process = _python("-X", "importtime", "-c", "import sys, json, {}; print(json.dumps([name for name in {!r} if "
+                      "name in sys.modules]))".format(module, GRAPHICS_MODULES))
+    children = []
+    # Lines are "import time: self | cumulative | name", the name indented by depth, with imports listed before
+    # the module importing them
+    for line in process.stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(cumulative) / 1e6))
+        elif depth == 0:
+            if name.strip() == module:
+                largest = sorted(children, key=lambda child: child[1], reverse=True)[:LARGEST_IMPORTS_SHOWN]
+                return int(cumulative) / 1e6, largest, json.loads(process.stdout)
+            children = []
+    raise ValueError("{} was not found in the import times".format(module))
+
+
+def time_to_intro():
+    """
+    :return: seconds from launching python to the first intro frame, and the seconds of each startup phase
+    """
+    start = time.perf_counter()
+    process = _python("-c", _INTRO_SCRIPT)
+    total = time.perf_counter() - start
+    phases = json.loads(process.stdout.splitlines()[-1])
+    # Whatever the child did not time itself is the interpreter starting and exiting
+    phases["interpreter"] = total - sum(phases.values())
+    return total, phases
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=INTRO_TIME_BUDGET,
+                        help="seconds the median launch may take to show the intro")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args()
+    failures = 0
+
+    has_arcade = importlib.util.find_spec("arcade") is not None
+    for module in HEADLESS_MODULES + (["main"] if has_arcade else []):
+        seconds, largest, graphics = import_breakdown(module)
+        print("{:16} {:8.1f} ms   {}".format(module, seconds * 1000, ", ".join(
+            "{} {:.1f}".format(name, child_seconds * 1000) for name, child_seconds in largest)))
+        if graphics and module != "main":
+            failures += 1
+            print("{:16} imports {}, it must stay importable without the graphics stack".format(
+                module, ", ".join(graphics)))
+
+    if not has_arcade:
+        print("time to intro skipped, arcade is not installed")
+        return 1 if failures else 0
+    runs = [time_to_intro() for _ in range(args.runs)]
+    median_total = statistics.median(total for total, _ in runs)
+    median_phases = {name: statistics.median(phases[name] for _, phases in runs) for name in runs[0][1]}
+    print("time to intro    {:8.1f} ms   {}   budget {:.0f} ms".format(median_total * 1000, ", ".join(
+        "{} {:.1f}".format(name, seconds * 1000) for name, seconds in median_phases.items()), args.budget * 1000))
+    if median_total > args.budget:
+        failures += 1
+        print("time to intro is over budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""
+Benchmarks of the physics, spawning and rendering hot paths, with fixed seeds.
+Results are written as json and compared with a stored baseline, failing on regressions above a threshold.
+Rendering benchmarks need arcade and an OpenGL context, and are skipped when those are not available.
+
+Run from the repository root:
+    python -m benchmarks.suite --save-baseline      store the current timings as the baseline
+    python -m benchmarks.suite                      compare against it
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+import numpy as np
+
+import keys
+from default_stages import SCREEN_HEIGHT, SCREEN_WIDTH, create_ocean_stage, create_regatta_stage, create_stages
+from game import PiratesGame
+from planner import LineGoal, RouteSearch
+from physics import BoatPhysics, get_lift_and_drag, get_scalar_lift_and_drag
+from replay import KEY_PRESS
+from sail_force import Force, PolarTable, drag_coef, lift_coef
+from server import GameServer, LoopbackClient
+from stage import BoatInitParams
+from telemetry import TelemetryRecorder
+from vpp import SpeedPolar
+from wind import WindField, WindSettings
+
+SEED = 0
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+REPEATS = 5
+
+BENCHMARKS = {}
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+def benchmark(name):
+    """
+    Registers a setup function, returning the callable to be timed.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _started_game(stage_index):
+    game = PiratesGame([create_stages()[stage_index]], seed=SEED)
+    game.on_key_press(keys.SPACE, 0)
+    return game
+
+
+def _largest_stage_index():
+    stages = create_stages()
+    return max(range(len(stages)), key=lambda index: stages[index].map_width * stages[index].map_height)
+
+
+@benchmark("calculate_speed")
+def _calculate_speed():
+    game = _started_game(6)
+    return game._calculate_speed
+
+
+@benchmark("get_lift_and_drag")
+def _get_lift_and_drag():
+    return lambda: get_lift_and_drag(0.3, 40.0, 2.0, 500, 0.8)
+
+
+@benchmark("get_scalar_lift_and_drag")
+def _get_scalar_lift_and_drag():
+    return lambda: get_scalar_lift_and_drag(0.3, 40.0, 2.0, 500, 0.8)
+
+
+@benchmark("force_from_cartesian")
+def _force_from_cartesian():
+    return lambda: Force.from_cartesian(12.5, -7.5)
+
+
+def _litter_interaction(litters_count):
+    game = _started_game(6)
+    rng = np.random.default_rng(SEED)
+    for litter_x, litter_y in zip(rng.uniform(0, game.stage.map_width, litters_count),
+                                  rng.uniform(0, game.stage.map_height, litters_count)):
+        game.litters.add(litter_x, litter_y)
+    return game._litter_interaction
+
+
+benchmark("litter_interaction_10k")(lambda: _litter_interaction(10000))
+benchmark("litter_interaction_100k")(lambda: _litter_interaction(100000))
+
+
+def _boat_physics_step(boats_count):
+    physics = BoatPhysics(boats_count)
+    physics.reset(BoatInitParams(SCREEN_WIDTH, SCREEN_HEIGHT))
+    physics.sail_angle_delta = np.random.default_rng(SEED).uniform(-3, 3, boats_count)
+    return lambda: physics.step(1 / 60, SCREEN_WIDTH * 2, SCREEN_HEIGHT * 2, True)
+
+
+benchmark("boat_physics_step_1k")(lambda: _boat_physics_step(1000))
+benchmark("boat_physics_step_100k")(lambda: _boat_physics_step(100000))
+
+
+@benchmark("fleet_update_300")
+def _fleet_update():
+    game = PiratesGame([create_regatta_stage(300)], seed=SEED)
+    game.on_key_press(keys.SPACE, 0)
+    for _ in range(600):
+        game.update(1 / 60)
+    return lambda: game.update(1 / 60)
+
+
+@benchmark("ocean_update_far_from_start")
+def _ocean_update():
+    game = PiratesGame([create_ocean_stage()], seed=SEED)
+    game.on_key_press(keys.SPACE, 0)
+    game.on_key_press(keys.LEFT, 0)
+    for _ in range(40):
+        game.update(1 / 60)
+    game.on_key_release(keys.LEFT, 0)
+    for _ in range(6000):
+        game.update(1 / 60)
+    return lambda: game.update(1 / 60)
+
+
+def _wind_field_sample(points_count):
+    rng = np.random.default_rng(SEED)
+    field = WindField(WindSettings(), SEED, 0, 50)
+    x = rng.uniform(0, 5200, points_count)
+    y = rng.uniform(0, 3000, points_count)
+    field.sample(x, y, 30)
+    return lambda: field.sample(x, y, 30)
+
+
+benchmark("wind_field_sample_300")(lambda: _wind_field_sample(300))
+benchmark("wind_field_sample_100k")(lambda: _wind_field_sample(100000))
+
+
+@benchmark("wind_field_sample_scalar")
+def _wind_field_sample_scalar():
+    field = WindField(WindSettings(), SEED, 0, 50)
+    field.sample_scalar(1000, 1000, 30)
+    return lambda: field.sample_scalar(1000, 1000, 30)
+
+
+@benchmark("route_search_upwind_stage")
+def _route_search():
+    game = _started_game(5)
+    speed_polar = SpeedPolar.load_or_solve(wind_speed=game.boat_constants.wind_speed)
+    goal = LineGoal(0, game.stage.map_width / 10, -1)
+    return lambda: RouteSearch(speed_polar, game.stage, game.boat_state, game.boat_constants, goal).step()
+
+
+@benchmark("telemetry_record_tick")
+def _telemetry_record_tick():
+    game = _started_game(6)
+    # The writer thread still compresses every chunk, only the file writes are discarded
+    game._telemetry = TelemetryRecorder(os.devnull)
+    return game._record_tick
+
+
+@benchmark("server_tick_30_players")
+def _server_tick():
+    game_server = GameServer(seed=SEED)
+    for client in [LoopbackClient(game_server) for _ in range(30)]:
+        client.send_input(KEY_PRESS, keys.SPACE, 0)
+        client.send_input(KEY_PRESS, keys.LEFT, 0)
+    for _ in range(100):
+        game_server.tick()
+    return game_server.tick
+
+
+@benchmark("polar_table_coefs_100k")
+def _polar_table_coefs():
+    table = PolarTable()
+    angles = np.random.default_rng(SEED).uniform(0, np.pi, 100000)
+    return lambda: table.coefs(angles)
+
+
+@benchmark("analytic_coefs_100k")
+def _analytic_coefs():
+    angles = np.random.default_rng(SEED).uniform(0, np.pi, 100000)
+    return lambda: (drag_coef(angles), lift_coef(angles))
+
+
+_window = None
+
+
+def _offscreen_window():
+    """
+    A single hidden game window shared by the rendering benchmarks, as opening windows is slow.
+    """
+    global _window
+    if _window is None:
+        try:
+            from main import Pirates
+            _window = Pirates(SCREEN_WIDTH, SCREEN_HEIGHT, create_stages(), visible=False, seed=SEED)
+        except Exception as error:
+            raise SkipBenchmark("no offscreen rendering context: {}".format(error))
+    return _window
+
+
+@benchmark("draw_waves_largest_stage")
+def _draw_waves():
+    window = _offscreen_window()
+    window._stage = window._stages[_largest_stage_index()]
+    window._on_stage_loaded()
+    window._start_stage()
+
+    def draw_waves():
+        window._draw_waves()
+        window.ctx.finish()
+    return draw_waves
+
+
+@benchmark("full_frame")
+def _full_frame():
+    window = _offscreen_window()
+    window._stage = window._stages[_largest_stage_index()]
+    window._on_stage_loaded()
+    window._start_stage()
+
+    def frame():
+        window.update(1 / 60)
+        window.on_draw()
+        window.ctx.finish()
+    return frame
+
+
+def run(names):
+    results = {}
+    for name in names:
+        try:
+            function = BENCHMARKS[name]()
+        except SkipBenchmark as reason:
+            print("{:28} skipped, {}".format(name, reason))
+            continue
+        timer = timeit.Timer(function)
+        number, _ = timer.autorange()
+        seconds_per_call = min(timer.repeat(REPEATS, number)) / number
+        results[name] = {"seconds_per_call": seconds_per_call, "calls": number}
+        print("{:28} {:12.3f} us".format(name, seconds_per_call * 1e6))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: names of the benchmarks slower than their baseline by more than threshold (a fraction)
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["seconds_per_call"] / baseline[name]["seconds_per_call"]
+        print("{:28} {:6.2f}x baseline{}".format(name, ratio, "  REGRESSION" if ratio > 1 + threshold else ""))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default="", help="only run the benchmarks with this in their name")
+    parser.add_argument("--output", help="write the results json to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 means 20%%")
+    args = parser.parse_args()
+
+    results = run([name for name in BENCHMARKS if args.filter in name])
+    report = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+              "benchmarks": results}
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=4)
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=4)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}, run with --save-baseline first".format(args.baseline))
+        return 0
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file)["benchmarks"], args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+import itertools
+import math
+import time
+
+import numpy as np
+
+import keys
+from game import PiratesGame
+from physics import LOCATION_SCALE, BoatPhysics
+from planner import LineGoal, PointGoal, RouteSearch, plan_tour
+
+DIRECTIONS = (-1, 0, 1)
+MAX_HEADING_CORRECTION = math.radians(20)
+
+
+def goal_location(game):
+    """
+    :return: the map location the boat should head to in order to meet the stage end condition, None if there is none
+    """
+    stage = game.stage
+    boat_state = game.boat_state
+    if stage.end_condition is PiratesGame.is_at_the_end_of_horizontal_stage:
+        return stage.map_width, boat_state.location_y
+    elif stage.end_condition is PiratesGame.is_at_the_end_of_vertical_stage:
+        return boat_state.location_x, stage.map_height
+    elif stage.end_condition is PiratesGame.is_at_the_start_of_horizontal_stage:
+        return 0, boat_state.location_y
+    elif stage.end_condition in (PiratesGame.is_score_enough, PiratesGame.is_never_over):
+        litters = [litter for _, litter in game.litters]
+        if litters:
+            return min(litters, key=lambda litter: math.dist(litter, (boat_state.location_x, boat_state.location_y)))
+    return None
+
+
+class GreedyController:
+    """
+    Every decision interval, simulates all the combinations of key presses for a short horizon as one batch of boats,
+    and keeps pressing the combination that ends up closest to the stage goal.
+    """
+    uses_speed_polar = False
+
+    def __init__(self, horizon=0.5, decision_interval=0.25, momentum_time=1):
+        self._horizon = horizon
+        self._decision_interval = decision_interval
+        self._momentum_time = momentum_time
+        self._last_decision_time = -math.inf
+
+    def control(self, game):
+        if game.time - self._last_decision_time < self._decision_interval:
+            return
+        self._last_decision_time = game.time
+        goal = goal_location(game)
+        if goal is None:
+            game.set_controls(0, 0, 0)
+            return
+
+        stage = game.stage
+        keel_directions = DIRECTIONS if stage.has_keel else (0,)
+        candidates = np.array(list(itertools.product(DIRECTIONS, DIRECTIONS, keel_directions)))
+        constants = game.boat_constants
+        physics = BoatPhysics(len(candidates), constants.wind_angle, constants.wind_speed, constants.polar)
+        physics.load_state(game.boat_state)
+        physics.sail_angle_delta = candidates[:, 0] * constants.sail_move_speed
+        physics.sail_openness_delta = candidates[:, 1] * constants.sail_open_speed
+        physics.keel_angle_delta = candidates[:, 2] * constants.keel_move_speed
+        for _ in range(round(self._horizon / game.physics_step_time)):
+            physics.step(game.physics_step_time, stage.map_width, stage.map_height, stage.has_keel)
+
+        # Moving fast towards the goal is worth more than being a bit closer to it and standing still
+        expected_x = physics.location_x + physics.speed_x * self._momentum_time * LOCATION_SCALE
+        expected_y = physics.location_y + physics.speed_y * self._momentum_time * LOCATION_SCALE
+        best = np.argmin(np.hypot(expected_x - goal[0], expected_y - goal[1]))
+        game.set_controls(*candidates[best])
+
+
+def _control_direction(current, target, max_step, period=None):
+    """
+    :param max_step: the most the control moves in a physics step
+    :param period: for angles, after how much they repeat - pi for the sail and keel, which push the same from
+    either of their ends
+    :return: direction from -1 to 1 moving the control to the target, a fraction of it when the target is less than
+    a step away, as the fastest controls of the polar are often right next to a stall
+    """
+    difference = target - current
+    if period is not None:
+        difference = (difference + period / 2) % period - period / 2
+    return min(max(difference / max_step, -1), 1)
+
+
+class AutopilotController:
+    """
+    Sails the fastest routes planner.RouteSearch finds: to the end line of a lesson stage, or along a tour of the
+    litter on stages that are won by score. Searches are stepped for time_budget seconds per control, and until one
+    is done the boat makes for its goal on the heading with the best speed made good towards it.
+    """
+    uses_speed_polar = True
+
+    def __init__(self, time_budget=0.002, cell_size=65, replan_interval=3, max_tour_size=8, max_cross_track=2,
+                 litter_reach=20, start_delay=None):
+        """
+        :param time_budget: seconds of search per control, None to finish every search at once, e.g. for validation
+        :param replan_interval: game seconds between searches from the boat, catching up with wind changes and drift
+        :param max_cross_track: distance off the route, in cells, at which it is searched again right away
+        :param litter_reach: how close to litter routes pass, less than the collecting reach to allow for drifting
+        :param start_delay: game seconds the intro screen is shown before the stage is started, None to wait for
+        the player
+        """
+        self._time_budget = time_budget
+        self._cell_size = cell_size
+        self._replan_interval = replan_interval
+        self._max_tour_size = max_tour_size
+        self._max_cross_track = max_cross_track
+        self._litter_reach = litter_reach
+        self._start_delay = start_delay
+        self._speed_polar = None
+        self._stage = None
+        self._intro_start_time = None
+        self._goal_key = None
+        self._search = None
+        self._last_search_time = -math.inf
+        self._litter_ids = frozenset()
+        self._tour = []
+        self.route = None
+        self._leg_index = 0
+
+    def control(self, game):
+        if not game.is_started:
+            self._wait_for_start(game)
+            return
+        self._intro_start_time = None
+        if game.stage is not self._stage:
+            self._stage = game.stage
+            self._goal_key = self._search = self.route = None
+            self._litter_ids = frozenset()
+            self._speed_polar = game.speed_polar
+
+        start_time = time.perf_counter()
+        goal_key, goal = self._next_goal(game)
+        if goal is None:
+            self._goal_key = self._search = self.route = None
+            game.set_controls(0, 0, 0)
+            return
+        if goal_key != self._goal_key:
+            self._goal_key = goal_key
+            self.route = None
+            self._start_search(game, goal)
+        elif self._search is None and game.time - self._last_search_time >= self._replan_interval:
+            self._start_search(game, goal)
+        # A new search is only stepped from the next control on, and gets whatever planning the tour left of the budget
+        elif self._search is not None:
+            time_budget = None
+            if self._time_budget is not None:
+                time_budget = self._time_budget - (time.perf_counter() - start_time)
+            if time_budget is None or time_budget > 0:
+                route = self._search.step(time_budget)
+                if self._search.is_done:
+                    self._search = None
+                    self.route = route
+                    self._leg_index = 0
+
+        constants = game.boat_constants
+        heading = self._heading(game, goal)
+        _, sail_angle, sail_openness, keel_angle = self._speed_polar.best(constants.wind_angle, heading)
+        if not math.isfinite(sail_angle):
+            # No heading the boat can sail makes progress towards the goal, like upwind without a keel, where the
+            # best one is a heading the polar has no controls for, so the controls are held as they are
+            game.set_controls(0, 0, 0)
+            return
+        boat_state = game.boat_state
+        step_time = game.physics_step_time
+        game.set_controls(
+            _control_direction(boat_state.sail_angle, float(sail_angle), constants.sail_move_speed * step_time,
+                               math.pi),
+            _control_direction(boat_state.sail_openness, float(sail_openness), constants.sail_open_speed * step_time),
+            _control_direction(boat_state.keel_angle, float(keel_angle), constants.keel_move_speed * step_time,
+                               math.pi) if game.stage.has_keel else 0)
+
+    def _wait_for_start(self, game):
+        if self._start_delay is None or game.is_finished:
+            return
+        if self._intro_start_time is None:
+            self._intro_start_time = game.time
+        elif game.time - self._intro_start_time >= self._start_delay:
+            game.on_key_press(keys.SPACE, 0)
+
+    def _next_goal(self, game):
+        """
+        :return: a key identifying the goal, to know when it changes, and the goal
+        """
+        stage = game.stage
+        if stage.end_condition is PiratesGame.is_at_the_end_of_horizontal_stage:
+            return "end", LineGoal(0, stage.map_width * 9 / 10, 1)
+        elif stage.end_condition is PiratesGame.is_at_the_end_of_vertical_stage:
+            return "end", LineGoal(1, stage.map_height * 9 / 10, 1)
+        elif stage.end_condition is PiratesGame.is_at_the_start_of_horizontal_stage:
+            return "end", LineGoal(0, stage.map_width / 10, -1)
+        elif stage.end_condition not in (PiratesGame.is_score_enough, PiratesGame.is_never_over):
+            return None, None
+
+        litter_ids, litter_x, litter_y = game.litters.as_arrays()
+        if frozenset(litter_ids.tolist()) != self._litter_ids:
+            # The tour is only planned again when litter is spawned or collected
+            self._litter_ids = frozenset(litter_ids.tolist())
+            boat_state = game.boat_state
+            order = plan_tour(self._speed_polar, game.boat_constants.wind_angle, boat_state.location_x,
+                              boat_state.location_y, litter_x, litter_y, self._max_tour_size, self._time_budget)
+            self._tour = [(int(litter_ids[index]), float(litter_x[index]), float(litter_y[index])) for index in order]
+        if not self._tour:
+            return None, None
+        litter_id, goal_x, goal_y = self._tour[0]
+        return litter_id, PointGoal(goal_x, goal_y, self._litter_reach)
+
+    def _start_search(self, game, goal):
+        self._last_search_time = game.time
+        boat_state = game.boat_state
+        islands = None
+        if game.ocean is not None:
+            margin = self._cell_size * 8
+            goal_x = getattr(goal, "x", boat_state.location_x)
+            goal_y = getattr(goal, "y", boat_state.location_y)
+            chunks = game.ocean.chunks_in_rect(min(boat_state.location_x, goal_x) - margin,
+                                               min(boat_state.location_y, goal_y) - margin,
+                                               max(boat_state.location_x, goal_x) + margin,
+                                               max(boat_state.location_y, goal_y) + margin)
+            islands = tuple(np.concatenate([getattr(chunk, name) for chunk in chunks] or [np.zeros(0)])
+                            for name in ("island_x", "island_y", "island_radius"))
+        self._search = RouteSearch(self._speed_polar, game.stage, boat_state, game.boat_constants, goal,
+                                   game.wind_field, game.base_wind_speed, game.time, islands, self._cell_size)
+
+    def _heading(self, game, goal):
+        """
+        :return: the heading of the current leg of the route, turned back towards it when drifting off it, or the
+        heading making the most progress towards the goal when there is no route to follow
+        """
+        boat_state = game.boat_state
+        wind_angle = game.boat_constants.wind_angle
+        direction = goal.direction_from(boat_state.location_x, boat_state.location_y)
+        if self.route:
+            # Legs are left once the boat is abreast of their end
+            while self._leg_index < len(self.route) and self._distance_along(
+                    self.route[self._leg_index], boat_state, end=True) >= -self._cell_size / 2:
+                self._leg_index += 1
+            if self._leg_index < len(self.route):
+                leg = self.route[self._leg_index]
+                cross_track = (math.cos(leg.heading) * (boat_state.location_y - leg.start_y) -
+                               math.sin(leg.heading) * (boat_state.location_x - leg.start_x))
+                if abs(cross_track) > self._max_cross_track * self._cell_size:
+                    self.route = None
+                    self._last_search_time = -math.inf
+                else:
+                    heading = leg.heading - min(max(cross_track / self._cell_size, -1), 1) * MAX_HEADING_CORRECTION
+                    if self._speed_polar.best(wind_angle, heading)[0] > 0:
+                        return heading
+                    if self._speed_polar.best(wind_angle, leg.heading)[0] > 0:
+                        return leg.heading
+            else:
+                # Sailed the whole route without reaching the goal
+                self.route = None
+                self._last_search_time = -math.inf
+        return float(self._speed_polar.best_vmg_heading(wind_angle, direction))
+
+    @staticmethod
+    def _distance_along(leg, boat_state, end=False):
+        x, y = (leg.end_x, leg.end_y) if end else (leg.start_x, leg.start_y)
+        return math.cos(leg.heading) * (boat_state.location_x - x) + math.sin(leg.heading) * (boat_state.location_y - y)
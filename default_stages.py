@@ -0,0 +1,36 @@
+import math
+import os
+
+from game import PiratesGame
+from ocean import OceanSettings
+from onscreen_text import heb
+from stage import Stage, BoatInitParams
+from wind import WindSettings
+
+SCREEN_WIDTH = 1300
+SCREEN_HEIGHT = 750
+BLACK = (0, 0, 0)
+DEFAULT_STAGES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stages", "lessons.json")
+
+
+def create_stages():
+    # Imported here, so the regatta and the ocean start without the stage loader and its cache
+    from stage_loader import StagePack
+    return StagePack(DEFAULT_STAGES_PATH)
+
+
+def create_regatta_stage(fleet_size=300):
+    return Stage(SCREEN_WIDTH * 4, SCREEN_HEIGHT * 4, BoatInitParams(SCREEN_WIDTH * 2, SCREEN_HEIGHT * 2), True, True,
+                 heb("רגאטה!", "התחרו בסירות האחרות על איסוף הלכלוך",
+                     "לחצו רווח כדי להתחיל"), [],
+                 PiratesGame.is_score_enough, 1, fleet_size)
+
+
+def create_ocean_stage():
+    ocean = OceanSettings(texts=[heb("ים פתוח, הפליגו לאן שתרצו"),
+                                 heb("זהירות, איים באזור!"),
+                                 heb("אספו את הלכלוך שבדרך")])
+    return Stage(math.inf, math.inf, BoatInitParams(0, 0), True, True,
+                 heb("ים פתוח!", "הפליגו לאן שתרצו ואספו לכלוך בדרך",
+                     "לחצו רווח כדי להתחיל"), [],
+                 PiratesGame.is_never_over, ocean=ocean, wind=WindSettings())
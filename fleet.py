@@ -0,0 +1,88 @@
+import math
+
+import numpy as np
+
+from physics import BORDER_MARGIN, BoatPhysics
+
+
+class Fleet:
+    """
+    AI boats racing the player for the litter of a stage. All of them are kept in one BoatPhysics and steered
+    together: every boat heads for its nearest litter on the heading that closes in on it fastest, with the sail, sail
+    openness and keel the speed polar gives for that heading.
+    """
+    def __init__(self, boats_count, stage, rng, boat_constants, speed_polar, reach_distance=30, wind_field=None):
+        self._stage = stage
+        self._wind_field = wind_field
+        self._boat_constants = boat_constants
+        self._reach_distance = reach_distance
+        self.physics = BoatPhysics(boats_count, boat_constants.wind_angle, boat_constants.wind_speed,
+                                   boat_constants.polar)
+        self.physics.reset(stage.boat_init_params)
+        self.physics.location_x[:] = rng.uniform(BORDER_MARGIN, stage.map_width - BORDER_MARGIN, boats_count)
+        self.physics.location_y[:] = rng.uniform(BORDER_MARGIN, stage.map_height - BORDER_MARGIN, boats_count)
+        self.physics.sail_angle[:] = rng.uniform(0, math.pi * 2, boats_count)
+        self.scores = np.zeros(boats_count, dtype=int)
+        self._speed_polar = speed_polar
+
+    def __len__(self):
+        return len(self.scores)
+
+    @staticmethod
+    def _direction_to(current, target, tolerance):
+        """
+        :return: -1, 0 or 1 per boat, the shorter way around from current to target angles
+        """
+        difference = np.mod(target - current + math.pi, math.pi * 2) - math.pi
+        return np.where(np.abs(difference) > tolerance, np.sign(difference), 0)
+
+    def steer(self, litter_x, litter_y, delta_time):
+        """
+        Sets the controls of all the boats, holding them still when there is no litter to go to.
+        :param delta_time: time until the next steer, the controls stop short of the target within one step of it
+        """
+        physics = self.physics
+        constants = self._boat_constants
+        if len(litter_x) == 0:
+            physics.sail_angle_delta = physics.sail_openness_delta = physics.keel_angle_delta = 0
+            return
+
+        nearest = np.argmin(np.hypot(physics.location_x[:, np.newaxis] - litter_x,
+                                     physics.location_y[:, np.newaxis] - litter_y), axis=1)
+        direction = np.arctan2(litter_y[nearest] - physics.location_y, litter_x[nearest] - physics.location_x)
+        heading = self._speed_polar.best_vmg_heading(physics.wind_angle, direction)
+        _, sail_angle, sail_openness, keel_angle = self._speed_polar.best(physics.wind_angle, heading)
+
+        physics.sail_angle_delta = constants.sail_move_speed * self._direction_to(
+            physics.sail_angle, sail_angle, constants.sail_move_speed * delta_time)
+        physics.keel_angle_delta = constants.keel_move_speed * self._direction_to(
+            physics.keel_angle, keel_angle, constants.keel_move_speed * delta_time)
+        openness_difference = sail_openness - physics.sail_openness
+        physics.sail_openness_delta = constants.sail_open_speed * np.where(
+            np.abs(openness_difference) > constants.sail_open_speed * delta_time, np.sign(openness_difference), 0)
+
+    def step(self, delta_time, time):
+        if self._wind_field is not None:
+            self.physics.wind_angle, self.physics.wind_speed = self._wind_field.sample(
+                self.physics.location_x, self.physics.location_y, time)
+        self.physics.step(delta_time, self._stage.map_width, self._stage.map_height, self._stage.has_keel)
+
+    def collect(self, litter_ids, litter_x, litter_y):
+        """
+        Scores the litters in reach of a boat, each going to the closest boat reaching it.
+        :return: ids of the collected litters, to be removed from the map
+        """
+        if len(litter_ids) == 0:
+            return litter_ids
+        distances = np.hypot(self.physics.location_x[:, np.newaxis] - litter_x,
+                             self.physics.location_y[:, np.newaxis] - litter_y)
+        closest_boats = np.argmin(distances, axis=0)
+        is_collected = distances[closest_boats, np.arange(len(litter_ids))] < self._reach_distance
+        np.add.at(self.scores, closest_boats[is_collected], 100)
+        return litter_ids[is_collected]
+
+    def rank(self, score):
+        """
+        :return: 1-based place of a player with this score among the fleet
+        """
+        return 1 + int(np.count_nonzero(self.scores > score))
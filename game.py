@@ -0,0 +1,498 @@
+import collections
+import enum
+import math
+import random
+
+import numpy as np
+
+import keys
+from fleet import Fleet
+from litter_grid import LitterGrid
+from ocean import OceanWorld
+from physics import BORDER_MARGIN, LOCATION_SCALE, BoatForces, calculate_scalar_forces, calculate_scalar_speed
+from sail_force import Force
+from telemetry_events import LITTER_COLLECTED, LITTER_DESPAWNED, LITTER_SPAWNED, LITTER_TAKEN, STAGE_ENDED, \
+    STAGE_STARTED
+from vpp import SpeedPolar
+from wind import WindField
+
+LITTER_CELL_SIZE = 130
+
+END_CONDITIONS = {}
+
+
+def end_condition(name):
+    """
+    Registers a PiratesGame method as a stage end condition, under the name stage files refer to it by.
+    """
+    def register(method):
+        END_CONDITIONS[name] = method
+        return method
+    return register
+
+
+class HelpModes(enum.Enum):
+    NO_HELP = 0
+    WIND = 1
+    ALL = 2
+
+
+class GameClock:
+    """
+    Time source advanced by the update delta times, so a game runs the same whether it is played live or replayed.
+    """
+    def __init__(self):
+        self.time = 0
+
+    def advance(self, delta_time):
+        self.time += delta_time
+
+
+BoatState = collections.namedtuple("BoatState", ["location_x", "location_y", "speed_x", "speed_y", "sail_angle",
+                                                "sail_openness", "keel_angle"])
+BoatConstants = collections.namedtuple("BoatConstants", ["wind_angle", "wind_speed", "sail_move_speed",
+                                                        "sail_open_speed", "keel_move_speed", "polar"])
+
+
+class PiratesGame:
+    """
+    The game logic - stages, boat, litter and score - without any drawing, so it can run without a window.
+    """
+    def __init__(self, stages, seed=None, physics_hz=60, max_physics_substeps=5, polar=None, input_recorder=None,
+                 wind_speed=50, sail_move_speed=3, sail_open_speed=0.35, keel_move_speed=3, autopilot=None,
+                 telemetry=None):
+        """
+        :param autopilot: controller steering the boat every update instead of the keys, like AutopilotController
+        :param telemetry: TelemetryRecorder recording every physics step and the stage and litter events
+        """
+        self._stages = stages
+        self._stage = stages[0]
+        self._stage_index = 0
+        self._is_started = False
+        self._is_finished = False
+        self._seed = random.randrange(2 ** 32) if seed is None else seed
+        self._random = random.Random(self._seed)
+        self._game_clock = GameClock()
+        self._input_recorder = input_recorder
+        self._autopilot = autopilot
+        self._telemetry = telemetry
+        self._sail_angle = 0
+        self._sail_openness = 1
+        self._keel_angle = math.pi
+        self._sail_angle_delta = 0
+        self._sail_openness_delta = 0
+        self._keel_angle_delta = 0
+        self._sail_move_speed = sail_move_speed
+        self._sail_open_speed = sail_open_speed
+        self._keel_move_speed = keel_move_speed
+        self._move_angle = 0
+        self._move_speed = 0
+        self._location_x = 0
+        self._location_y = 0
+        self._previous_location_x = 0
+        self._previous_location_y = 0
+        self._draw_location_x = 0
+        self._draw_location_y = 0
+        self._physics_step_time = 1 / physics_hz
+        self._max_physics_substeps = max_physics_substeps
+        self._physics_time_accumulator = 0
+        self._polar = polar
+        self._speed_x = 0
+        self._speed_y = 0
+        self._base_wind_angle = 0
+        self._base_wind_speed = wind_speed
+        self._wind_angle = self._base_wind_angle
+        self._wind_speed = self._base_wind_speed
+        self._wind_field = None
+        self._help_mode = HelpModes.NO_HELP
+        self._forces = BoatForces()
+        self._litters = LitterGrid(LITTER_CELL_SIZE)
+        self._last_spawn_time = -math.inf
+        self._reach_distance = 30
+        self._last_collect_time = -math.inf
+        self._score = 0
+        self._fleet = None
+        self._ocean = None
+        self._reset_speed_polar()
+
+    @property
+    def stage(self):
+        return self._stage
+
+    @property
+    def stage_index(self):
+        return self._stage_index
+
+    @property
+    def is_started(self):
+        return self._is_started
+
+    @property
+    def is_finished(self):
+        return self._is_finished
+
+    @property
+    def score(self):
+        return self._score
+
+    @property
+    def fleet(self):
+        return self._fleet
+
+    @property
+    def ocean(self):
+        return self._ocean
+
+    @property
+    def wind_field(self):
+        return self._wind_field
+
+    @property
+    def base_wind_speed(self):
+        return self._base_wind_speed
+
+    @property
+    def autopilot(self):
+        return self._autopilot
+
+    @property
+    def speed_polar(self):
+        """
+        The speed polar of the boat on the current stage. When the fleet or the autopilot needs it, it is solved in
+        the background from when the stage is loaded, so reading it only waits if a stage is started right away on a
+        cold cache. Otherwise it is solved the first time it is read.
+        """
+        if self._speed_polar_future is None:
+            self._prefetch_speed_polar()
+        return self._speed_polar_future.result()
+
+    @property
+    def litters(self):
+        return self._litters
+
+    @property
+    def time(self):
+        return self._game_clock.time
+
+    @property
+    def physics_step_time(self):
+        return self._physics_step_time
+
+    @property
+    def boat_state(self):
+        return BoatState(self._location_x, self._location_y, self._speed_x, self._speed_y, self._sail_angle,
+                         self._sail_openness, self._keel_angle)
+
+    @property
+    def boat_constants(self):
+        return BoatConstants(self._wind_angle, self._wind_speed, self._sail_move_speed, self._sail_open_speed,
+                             self._keel_move_speed, self._polar)
+
+    def set_controls(self, sail_direction, sail_openness_direction, keel_direction):
+        """
+        Steers the boat like holding the arrow and A/D keys would, each direction being -1, 0 or 1, or a fraction for
+        finer control than the keys give.
+        """
+        self._sail_angle_delta = sail_direction * self._sail_move_speed
+        self._sail_openness_delta = sail_openness_direction * self._sail_open_speed
+        self._keel_angle_delta = keel_direction * self._keel_move_speed
+
+    def _on_stage_loaded(self):
+        pass
+
+    def _prefetch_speed_polar(self):
+        self._speed_polar_future = SpeedPolar.prefetch(wind_speed=self._base_wind_speed, polar=self._polar,
+                                                       has_keel=self._stage.has_keel)
+
+    def _reset_speed_polar(self):
+        """
+        Forgets the polar of the previous stage, and starts solving this stage's if anything on it will read it.
+        """
+        self._speed_polar_future = None
+        if self._stage.fleet_size or (self._autopilot is not None and self._autopilot.uses_speed_polar):
+            self._prefetch_speed_polar()
+
+    def _on_stage_started(self):
+        pass
+
+    def _on_litter_spawned(self, litter_id, litter_x, litter_y):
+        pass
+
+    def _on_litter_collected(self, litter_id):
+        pass
+
+    def _on_litter_despawned(self, litter_id):
+        pass
+
+    def _on_ocean_chunk_loaded(self, chunk):
+        pass
+
+    def _on_ocean_chunk_evicted(self, chunk):
+        pass
+
+    def update(self, delta_time):
+        if self._input_recorder is not None:
+            self._input_recorder.record_tick(delta_time)
+        self._game_clock.advance(delta_time)
+        if self._autopilot is not None:
+            self._autopilot.control(self)
+        if not self._is_started:
+            return
+        elif self._stage.end_condition(self):
+            self._end_stage()
+            return
+
+        if self._fleet is not None:
+            _, litter_x, litter_y = self._litters.as_arrays()
+            self._fleet.steer(litter_x, litter_y, delta_time)
+
+        self._physics_time_accumulator += delta_time
+        substeps = 0
+        while self._physics_time_accumulator >= self._physics_step_time:
+            if substeps == self._max_physics_substeps:
+                # Drop the backlog of a stalled frame instead of spiraling into more and more catch-up steps
+                self._physics_time_accumulator = 0
+                break
+            self._previous_location_x, self._previous_location_y = self._location_x, self._location_y
+            self._physics_step(self._physics_step_time)
+            if self._telemetry is not None:
+                self._record_tick()
+            self._physics_time_accumulator -= self._physics_step_time
+            substeps += 1
+
+        interpolation = self._physics_time_accumulator / self._physics_step_time
+        self._draw_location_x = (self._previous_location_x +
+                                 (self._location_x - self._previous_location_x) * interpolation)
+        self._draw_location_y = (self._previous_location_y +
+                                 (self._location_y - self._previous_location_y) * interpolation)
+
+        if self._ocean is not None:
+            self._update_ocean()
+        if self._stage.has_litter:
+            if self._ocean is None:
+                self._spawn_litter()
+            self._litter_interaction()
+            if self._fleet is not None:
+                self._fleet_interaction()
+
+    def _physics_step(self, delta_time):
+        if self._wind_field is not None:
+            self._wind_angle, self._wind_speed = self._wind_field.sample_scalar(self._location_x, self._location_y,
+                                                                                self._game_clock.time)
+        self._sail_angle = (self._sail_angle + self._sail_angle_delta * delta_time) % (math.pi * 2)
+        self._sail_openness = min(max(self._sail_openness + self._sail_openness_delta * delta_time, 0), 1)
+        if self._stage.has_keel:
+            self._keel_angle = (self._keel_angle + self._keel_angle_delta * delta_time) % (math.pi * 2)
+
+        self._speed_x, self._speed_y = self._calculate_speed()
+        if self._ocean is not None:
+            self._move_in_open_water(delta_time)
+        else:
+            self._location_x = min(max(self._location_x + self._speed_x * delta_time * LOCATION_SCALE,
+                                       BORDER_MARGIN), self._stage.map_width - BORDER_MARGIN)
+            self._location_y = min(max(self._location_y + self._speed_y * delta_time * LOCATION_SCALE,
+                                       BORDER_MARGIN), self._stage.map_height - BORDER_MARGIN)
+        if self._fleet is not None:
+            self._fleet.step(delta_time, self._game_clock.time)
+
+    def _record_tick(self):
+        self._telemetry.record_tick(self._game_clock.time, self._stage_index, self._score, self._location_x,
+                                    self._location_y, self._speed_x, self._speed_y, self._sail_angle,
+                                    self._sail_openness, self._keel_angle, self._wind_angle, self._wind_speed,
+                                    self._forces)
+
+    def _record_event(self, kind, subject_id, x=math.nan, y=math.nan):
+        if self._telemetry is not None:
+            self._telemetry.record_event(kind, self._game_clock.time, subject_id, x, y)
+
+    def _record_litter_event(self, kind, litter_id):
+        """
+        Records an event of a litter still in the grid, looking its location up only when recording.
+        """
+        if self._telemetry is not None:
+            self._record_event(kind, litter_id, *self._litters.get(litter_id))
+
+    def _move_in_open_water(self, delta_time):
+        """
+        Moves the boat on an endless ocean, where islands stop it instead of the map borders.
+        """
+        self._location_x, self._location_y, is_aground = self._ocean.push_out_of_islands(
+            self._location_x + self._speed_x * delta_time * LOCATION_SCALE,
+            self._location_y + self._speed_y * delta_time * LOCATION_SCALE)
+        if is_aground:
+            self._speed_x = self._speed_y = 0
+
+    def _update_ocean(self):
+        loaded, evicted = self._ocean.update(self._location_x, self._location_y)
+        for chunk in evicted:
+            for litter_id in chunk.litter_ids:
+                self._record_litter_event(LITTER_DESPAWNED, litter_id)
+                self._litters.remove(litter_id)
+                self._on_litter_despawned(litter_id)
+            self._on_ocean_chunk_evicted(chunk)
+        for chunk in loaded:
+            for index, litter_x, litter_y in self._ocean.uncollected_litter(chunk):
+                litter_id = self._litters.add(litter_x, litter_y)
+                self._ocean.attach_litter(chunk, index, litter_id)
+                self._record_event(LITTER_SPAWNED, litter_id, litter_x, litter_y)
+                self._on_litter_spawned(litter_id, litter_x, litter_y)
+            self._on_ocean_chunk_loaded(chunk)
+
+    def _litter_interaction(self):
+        for litter_id in self._litters.query_radius(self._location_x, self._location_y, self._reach_distance):
+            self._record_litter_event(LITTER_COLLECTED, litter_id)
+            self._litters.remove(litter_id)
+            if self._ocean is not None:
+                self._ocean.collect_litter(litter_id)
+            self._on_litter_collected(litter_id)
+            self._last_collect_time = self._game_clock.time
+            self._score += 100
+
+    def _fleet_interaction(self):
+        for litter_id in self._fleet.collect(*self._litters.as_arrays()).tolist():
+            self._record_litter_event(LITTER_TAKEN, litter_id)
+            self._litters.remove(litter_id)
+            self._on_litter_collected(litter_id)
+
+    def _spawn_litter(self):
+        if self._game_clock.time - self._last_spawn_time > self._stage.litter_spawn_rate:
+            litter_x = self._random.random() * self._stage.map_width
+            litter_y = self._random.random() * self._stage.map_height
+            litter_id = self._litters.add(litter_x, litter_y)
+            self._record_event(LITTER_SPAWNED, litter_id, litter_x, litter_y)
+            self._on_litter_spawned(litter_id, litter_x, litter_y)
+            self._last_spawn_time = self._game_clock.time
+
+    def _calculate_speed(self):
+        calculate_scalar_forces(self._forces, self._speed_x, self._speed_y, self._sail_angle, self._sail_openness,
+                                self._keel_angle, self._stage.has_keel, self._wind_angle, self._wind_speed,
+                                self._polar)
+        return calculate_scalar_speed(self._speed_x, self._speed_y, self._forces, self._physics_step_time)
+
+    # The polar forms of the forces are only needed for drawing, so they are derived from the cartesian forces
+    # when read instead of every tick
+    @property
+    def _wind_drag(self):
+        return Force.from_cartesian(self._forces.wind_drag_x, self._forces.wind_drag_y)
+
+    @property
+    def _wind_lift(self):
+        return Force.from_cartesian(self._forces.wind_lift_x, self._forces.wind_lift_y)
+
+    @property
+    def _water_drag(self):
+        return Force.from_cartesian(self._forces.water_drag_x, self._forces.water_drag_y)
+
+    @property
+    def _water_lift(self):
+        return Force.from_cartesian(self._forces.water_lift_x, self._forces.water_lift_y)
+
+    def on_key_press(self, symbol: int, modifiers: int):
+        if self._input_recorder is not None:
+            self._input_recorder.record_key_press(symbol, modifiers)
+        if not self._is_started and not self._is_finished:
+            if symbol == keys.SPACE:
+                self._start_stage()
+            return
+
+        if symbol == keys.RIGHT:
+            self._sail_angle_delta = -self._sail_move_speed
+        elif symbol == keys.LEFT:
+            self._sail_angle_delta = self._sail_move_speed
+        elif symbol == keys.UP:
+            self._sail_openness_delta = self._sail_open_speed
+        elif symbol == keys.DOWN:
+            self._sail_openness_delta = -self._sail_open_speed
+        elif symbol == keys.D:
+            self._keel_angle_delta = -self._keel_move_speed
+        elif symbol == keys.A:
+            self._keel_angle_delta = self._keel_move_speed
+        elif symbol == keys.H:
+            self._help_mode = HelpModes((self._help_mode.value + 1) % len(HelpModes))
+
+    def _start_stage(self):
+        self._location_x = self._stage.boat_init_params.location_x
+        self._location_y = self._stage.boat_init_params.location_y
+        self._previous_location_x = self._draw_location_x = self._location_x
+        self._previous_location_y = self._draw_location_y = self._location_y
+        self._physics_time_accumulator = 0
+        self._sail_angle = self._stage.boat_init_params.sail_angel
+        self._keel_angle = self._stage.boat_init_params.keel_angel
+        self._sail_openness = self._stage.boat_init_params.sail_openness
+        self._litters.clear()
+        self._last_spawn_time = -math.inf
+        self._last_collect_time = -math.inf
+        self._score = 0
+        self._fleet = None
+        self._ocean = None
+        self._wind_field = None
+        self._wind_angle = self._base_wind_angle
+        self._wind_speed = self._base_wind_speed
+        if self._stage.wind is not None:
+            self._wind_field = WindField(self._stage.wind, self._random.randrange(2 ** 32), self._base_wind_angle,
+                                         self._base_wind_speed)
+        if self._stage.ocean is not None:
+            self._ocean = OceanWorld(self._stage.ocean, self._random.randrange(2 ** 32), self._location_x,
+                                     self._location_y)
+        if self._stage.fleet_size:
+            self._fleet = Fleet(self._stage.fleet_size, self._stage,
+                                np.random.default_rng(self._random.randrange(2 ** 32)), self.boat_constants,
+                                self.speed_polar, self._reach_distance, self._wind_field)
+        self._record_event(STAGE_STARTED, self._stage_index, self._location_x, self._location_y)
+        self._on_stage_started()
+        if self._ocean is not None:
+            self._update_ocean()
+        self._is_started = True
+
+    def _end_stage(self):
+        self._is_started = False
+        self._record_event(STAGE_ENDED, self._stage_index, self._location_x, self._location_y)
+        if self._telemetry is not None:
+            # A stage is a natural point to get its last rows to disk, instead of waiting for a full chunk
+            self._telemetry.flush()
+        self._stage_index += 1
+        if self._stage_index < len(self._stages):
+            self._stage = self._stages[self._stage_index]
+            self._reset_speed_polar()
+            self._on_stage_loaded()
+        else:
+            self._is_finished = True
+
+    def on_key_release(self, symbol: int, modifiers: int):
+        if self._input_recorder is not None:
+            self._input_recorder.record_key_release(symbol, modifiers)
+        if symbol in [keys.RIGHT, keys.LEFT]:
+            self._sail_angle_delta = 0
+        elif symbol in [keys.UP, keys.DOWN]:
+            self._sail_openness_delta = 0
+        elif symbol in [keys.A, keys.D]:
+            self._keel_angle_delta = 0
+
+    def final_state(self):
+        return {
+            "stage_index": self._stage_index,
+            "is_finished": self._is_finished,
+            "score": self._score,
+            "location_x": float(self._location_x),
+            "location_y": float(self._location_y),
+        }
+
+    @end_condition("end_of_horizontal_stage")
+    def is_at_the_end_of_horizontal_stage(self):
+        return self._location_x > self._stage.map_width * 9 / 10
+
+    @end_condition("end_of_vertical_stage")
+    def is_at_the_end_of_vertical_stage(self):
+        return self._location_y > self._stage.map_height * 9 / 10
+
+    @end_condition("start_of_horizontal_stage")
+    def is_at_the_start_of_horizontal_stage(self):
+        return self._location_x < self._stage.map_width / 10
+
+    @end_condition("never")
+    def is_never_over(self):
+        return False
+
+    @end_condition("score_enough")
+    def is_score_enough(self):
+        return self._score >= 1000
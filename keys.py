@@ -0,0 +1,10 @@
+# Same values as arcade.key, so the game logic can handle key presses without importing arcade
+SPACE = 32
+A = 97
+D = 100
+H = 104
+P = 112
+LEFT = 65361
+UP = 65362
+RIGHT = 65363
+DOWN = 65364
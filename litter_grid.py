@@ -0,0 +1,98 @@
+import math
+
+import numpy as np
+
+
+class LitterGrid:
+    """
+    Litter store bucketed into a uniform grid of square cells, so pickup and drawing only look at the cells
+    around the boat / inside the viewport instead of at every litter item on the map.
+    """
+    def __init__(self, cell_size):
+        self._cell_size = cell_size
+        self._cells = {}
+        self._litters = {}
+        self._next_id = 0
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._litters)
+
+    def __iter__(self):
+        return iter(self._litters.items())
+
+    def _cell_of(self, x, y):
+        return int(x // self._cell_size), int(y // self._cell_size)
+
+    def _cells_in_range(self, left, bottom, right, top):
+        min_column, min_row = self._cell_of(left, bottom)
+        max_column, max_row = self._cell_of(right, top)
+        for column in range(min_column, max_column + 1):
+            for row in range(min_row, max_row + 1):
+                cell = self._cells.get((column, row))
+                if cell:
+                    yield cell
+
+    def add(self, x, y):
+        """
+        :return: id of the new litter, used to remove it later
+        """
+        litter_id = self._next_id
+        self._next_id += 1
+        self._litters[litter_id] = (x, y)
+        self._arrays = None
+        self._cells.setdefault(self._cell_of(x, y), set()).add(litter_id)
+        return litter_id
+
+    def remove(self, litter_id):
+        x, y = self._litters.pop(litter_id)
+        self._arrays = None
+        cell_key = self._cell_of(x, y)
+        cell = self._cells[cell_key]
+        cell.discard(litter_id)
+        if not cell:
+            del self._cells[cell_key]
+
+    def get(self, litter_id):
+        return self._litters[litter_id]
+
+    def clear(self):
+        self._cells.clear()
+        self._litters.clear()
+        self._arrays = None
+
+    def as_arrays(self):
+        """
+        Built again only after litter was added or removed, so reading them several times per update is free.
+        :return: ids, x coordinates and y coordinates of all the litters, as read only numpy arrays
+        """
+        if self._arrays is None:
+            ids = np.fromiter(self._litters.keys(), dtype=int, count=len(self._litters))
+            locations = np.array(list(self._litters.values()), dtype=float).reshape(-1, 2)
+            self._arrays = (ids, locations[:, 0], locations[:, 1])
+            for array in self._arrays:
+                array.flags.writeable = False
+        return self._arrays
+
+    def query_radius(self, x, y, radius):
+        """
+        :return: ids of the litters strictly closer than radius to (x, y)
+        """
+        found = []
+        for cell in self._cells_in_range(x - radius, y - radius, x + radius, y + radius):
+            for litter_id in cell:
+                if math.dist(self._litters[litter_id], (x, y)) < radius:
+                    found.append(litter_id)
+        return found
+
+    def query_rect(self, left, bottom, right, top):
+        """
+        :return: (id, (x, y)) of the litters strictly inside the rectangle
+        """
+        found = []
+        for cell in self._cells_in_range(left, bottom, right, top):
+            for litter_id in cell:
+                x, y = self._litters[litter_id]
+                if left < x < right and bottom < y < top:
+                    found.append((litter_id, (x, y)))
+        return found
@@ -1,71 +1,63 @@
+import argparse
 import math
 import random
-import time
 
 import arcade
 import numpy as np
-import enum
 
-from onscreen_text import OnscreenText
-from sail_force import lift_coef, drag_coef, Force
-from stage import Stage, BoatInitParams
+import keys
+from default_stages import SCREEN_WIDTH, SCREEN_HEIGHT, create_ocean_stage, create_regatta_stage, create_stages, heb
+from game import HelpModes, PiratesGame
+from text_cache import TextCache
 
-SCREEN_WIDTH = 1300
-SCREEN_HEIGHT = 750
 BACKGROUND_COLOR = arcade.color.OCEAN_BOAT_BLUE
-
-
-class HelpModes(enum.Enum):
-    NO_HELP = 0
-    WIND = 1
-    ALL = 2
-
-
-class Pirates(arcade.Window):
-    def __init__(self, width, height, stages):
-        super().__init__(width, height)
+PROFILED_SECTIONS = ["on_draw", "_draw_waves", "_draw_ocean", "_draw_wind_field", "_draw_litter", "_draw_fleet",
+                     "_draw_route", "_draw_boat", "_draw_borders", "_draw_wind_arrow", "_draw_force_scaffolds",
+                     "_draw_messages", "_draw_score", "_draw_rank", "_draw_onscreen_texts", "_physics_step",
+                     "_spawn_litter", "_litter_interaction", "_fleet_interaction", "_update_ocean"]
+PROFILER_REFRESH_FRAMES = 15
+HIDDEN_SPRITE_LOCATION = -1000
+WIND_FIELD_SPACING = 130
+DEMO_START_DELAY = 4
+
+
+class Pirates(PiratesGame, arcade.Window):
+    def __init__(self, width, height, stages, profile_dump_path=None, visible=True, **game_options):
+        arcade.Window.__init__(self, width, height, visible=visible)
+        PiratesGame.__init__(self, stages, **game_options)
         arcade.set_background_color(BACKGROUND_COLOR)
-        self._stages = stages
-        self._stage = stages[0]
-        self._stage_index = 0
-        self._is_started = False
-        self._is_finished = False
-        self._sail_angle = 0
-        self._sail_openness = 1
-        self._keel_angle = math.pi
         self._boat_x = width / 2
         self._boat_y = height / 2
-        self._sail_angle_delta = 0
-        self._sail_openness_delta = 0
-        self._keel_angle_delta = 0
         self._mast_length = 60
         self._keel_length = 35
-        self._sail_move_speed = 3
-        self._sail_open_speed = 0.35
-        self._keel_move_speed = 3
-        self._move_angle = 0
-        self._move_speed = 0
-        self._location_x = 0
-        self._location_y = 0
         self._wave_margin = width / 10
         self._wave_x_coords = []
         self._wave_y_coords = []
-        self._speed_x = 0
-        self._speed_y = 0
-        self._wind_angle = 0
-        self._wind_speed = 50
+        self._wave_shapes = arcade.ShapeElementList()
+        self._chunk_shapes = {}
+        self._world_camera = arcade.Camera(width, height)
+        self._screen_camera = arcade.Camera(width, height)
         self._wind_arrow_length = 70
-        self._help_mode = HelpModes.NO_HELP
-        self._wind_drag = Force(0, 0)
-        self._wind_lift = Force(0, 0)
-        self._water_drag = Force(0, 0)
-        self._water_lift = Force(0, 0)
-        self._litters = []
-        self._last_spawn_time = 0
-        self._reach_distance = 30
-        self._last_collect_time = 0
+        self._litter_sprites = arcade.SpriteList()
+        self._litter_sprite_by_id = {}
         self._collect_message_display_time = 1
-        self._score = 0
+        self._drawn_score = 0
+        self._score_text = arcade.Text(" 0", 300, height - 100)
+        self._fleet_sprites = arcade.SpriteList()
+        self._shown_fleet_sprites = 0
+        self._drawn_rank = None
+        self._rank_text = arcade.Text("", 300, height - 130)
+        self._texts = TextCache()
+        # The profiler is only loaded once profiling is turned on, or when its results are to be dumped
+        self._profiler = None
+        self._profile_dump_path = profile_dump_path
+        if profile_dump_path is not None:
+            self._load_profiler()
+        self._profiler_texts = {}
+        self._profiler_frames = 0
+        self._is_intro_drawn = False
+        self._is_stage_prepared = False
+        self._on_stage_loaded()
 
     def on_draw(self):
         """ Render the screen. """
@@ -77,59 +69,171 @@ class Pirates(arcade.Window):
                 self._draw_intro_screen()
             return
 
+        # Waves and litter are drawn in map coordinates, scrolled by the world camera
+        self._world_camera.move_to((self._draw_location_x - (self.width / 2),
+                                    self._draw_location_y - (self.height / 2)))
+        self._world_camera.use()
         self._draw_waves()
+        self._draw_ocean()
+        self._draw_wind_field()
         self._draw_litter()
+        self._draw_fleet()
+        self._draw_route()
+        self._screen_camera.use()
         self._draw_boat()
         self._draw_borders()
         self._draw_wind_arrow()
         self._draw_force_scaffolds()
         self._draw_messages()
         self._draw_score()
+        self._draw_rank()
         self._draw_onscreen_texts()
+        if self._profiler is not None and self._profiler.is_enabled:
+            self._draw_profiler_overlay()
+
+    def _load_profiler(self):
+        from profiler import FrameProfiler
+        self._profiler = FrameProfiler(self, PROFILED_SECTIONS)
+
+    def _toggle_profiler(self):
+        if self._profiler is None:
+            self._load_profiler()
+        self._profiler.toggle()
+
+    def _draw_profiler_overlay(self):
+        # The numbers are only re-laid out every few frames, to keep the overlay itself cheap
+        if self._profiler_frames % PROFILER_REFRESH_FRAMES == 0:
+            for index, (name, (p50, p95, p99)) in enumerate(self._profiler.percentiles().items()):
+                line = "{:22} p50 {:6.2f}  p95 {:6.2f}  p99 {:6.2f} ms".format(name, p50, p95, p99)
+                if name not in self._profiler_texts:
+                    self._profiler_texts[name] = arcade.Text(line, self.width - 450, self.height - 30 - index * 18,
+                                                             arcade.color.BLACK, 10, font_name="Courier New")
+                else:
+                    self._profiler_texts[name].text = line
+        self._profiler_frames += 1
+        for text in self._profiler_texts.values():
+            text.draw()
 
     def _draw_onscreen_texts(self):
         for text in self._stage.stage_texts:
             if self._is_location_in_screen_visibility(text.location_x, text.location_y):
-                arcade.draw_text(text.text,
-                                 text.location_x - (self._location_x - (self.width / 2)),
-                                 text.location_y - (self._location_y - (self.height / 2)),
+                self._texts.draw(text.text,
+                                 text.location_x - (self._draw_location_x - (self.width / 2)),
+                                 text.location_y - (self._draw_location_y - (self.height / 2)),
                                  font_size=text.size, **text.kwargs)
 
     def _is_location_in_screen_visibility(self, location_x, location_y):
-        return (self._location_x - (self.width / 2) < location_x < self._location_x + (self.width / 2) and
-                self._location_y - (self.height / 2) < location_y < self._location_y + (self.height / 2))
+        return (self._draw_location_x - (self.width / 2) < location_x < self._draw_location_x + (self.width / 2) and
+                self._draw_location_y - (self.height / 2) < location_y < self._draw_location_y + (self.height / 2))
 
     def _draw_intro_screen(self):
-        arcade.draw_text(self._stage.intro_text, self.width * 2 / 5, self.height / 2, width=self.width / 2, font_size=20, multiline=True)
+        # A stage pack may leave the intro text empty, which has nothing to draw
+        intro_text = self._prepare_intro_text()
+        if intro_text is not None:
+            intro_text.draw()
+        self._is_intro_drawn = True
+
+    def _prepare_intro_text(self):
+        return self._texts.prepare(self._stage.intro_text, self.width * 2 / 5, self.height / 2, width=self.width / 2,
+                                   font_size=20, multiline=True)
 
     def _draw_end_screen(self):
-        arcade.draw_text(heb("זה הכל, תודה ששיחקתם!"), self.width * 2 / 5, self.height / 2, width=self.width / 2, font_size=20, multiline=True)
+        self._texts.draw(heb("זה הכל, תודה ששיחקתם!"), self.width * 2 / 5, self.height / 2,
+                         width=self.width / 2, font_size=20, multiline=True)
 
     def _draw_score(self):
-        arcade.draw_text(" {}".format(self._score), 300, self.height - 100)
+        if self._score != self._drawn_score:
+            self._score_text.text = " {}".format(self._score)
+            self._drawn_score = self._score
+        self._score_text.draw()
+
+    def _draw_rank(self):
+        if self._fleet is None:
+            return
+        rank = self._fleet.rank(self._score)
+        if rank != self._drawn_rank:
+            self._rank_text.text = "{}/{}".format(rank, len(self._fleet) + 1)
+            self._drawn_rank = rank
+        self._rank_text.draw()
 
     def _draw_messages(self):
-        if time.time() - self._last_collect_time < self._collect_message_display_time:
-            arcade.draw_text(" +100", self._boat_x * 1.05, self._boat_y * 1.05, arcade.color.GREEN, bold=True)
+        if self._game_clock.time - self._last_collect_time < self._collect_message_display_time:
+            self._texts.draw(" +100", self._boat_x * 1.05, self._boat_y * 1.05, arcade.color.GREEN, bold=True)
 
     def _draw_litter(self):
-        for litter in self._litters:
-            if self._is_location_in_screen_visibility(litter[0], litter[1]):
-                arcade.draw_circle_filled(litter[0] - (self._location_x - (self.width / 2)),
-                                          litter[1] - (self._location_y - (self.height / 2)),
-                                          8, arcade.color.BULGARIAN_ROSE)
+        self._litter_sprites.draw()
+
+    def _draw_fleet(self):
+        """
+        Draws only the fleet boats inside the viewport: their hulls from a pool of sprites and all their sails with a
+        single batched lines call.
+        """
+        if self._fleet is None:
+            return
+        physics = self._fleet.physics
+        margin = self._mast_length
+        left = self._draw_location_x - self.width / 2 - margin
+        bottom = self._draw_location_y - self.height / 2 - margin
+        visible = np.nonzero(
+            (left < physics.location_x) & (physics.location_x < left + self.width + margin * 2) &
+            (bottom < physics.location_y) & (physics.location_y < bottom + self.height + margin * 2))[0]
+        location_x = physics.location_x[visible]
+        location_y = physics.location_y[visible]
+
+        while len(self._fleet_sprites) < len(visible):
+            self._fleet_sprites.append(arcade.SpriteCircle(20, arcade.color.GRAY))
+        for sprite, sprite_x, sprite_y in zip(self._fleet_sprites, location_x.tolist(), location_y.tolist()):
+            sprite.center_x = sprite_x
+            sprite.center_y = sprite_y
+        # Sprites left over from a frame with more boats in view are moved away instead of removed, to be reused
+        for sprite in self._fleet_sprites[len(visible):self._shown_fleet_sprites]:
+            sprite.center_x = sprite.center_y = HIDDEN_SPRITE_LOCATION
+        self._shown_fleet_sprites = len(visible)
+        self._fleet_sprites.draw()
+
+        if len(visible):
+            sail_angle = physics.sail_angle[visible]
+            sail_length = self._mast_length * physics.sail_openness[visible]
+            points = np.empty((len(visible) * 2, 2))
+            points[0::2, 0] = location_x
+            points[0::2, 1] = location_y
+            points[1::2, 0] = location_x + np.cos(sail_angle) * sail_length
+            points[1::2, 1] = location_y + np.sin(sail_angle) * sail_length
+            arcade.draw_lines(points.tolist(), arcade.color.WHITE, 3)
 
     def _draw_force_scaffolds(self):
         if self._help_mode == HelpModes.WIND or self._help_mode == HelpModes.ALL:
-            self._draw_arrow(self._boat_x, self._boat_y, self._wind_drag.size, self._wind_drag.angle,
+            wind_drag, wind_lift = self._wind_drag, self._wind_lift
+            self._draw_arrow(self._boat_x, self._boat_y, wind_drag.size, wind_drag.angle,
                              arcade.color.BLACK, 5, "Wind drag")
-            self._draw_arrow(self._boat_x, self._boat_y, self._wind_lift.size, self._wind_lift.angle,
+            self._draw_arrow(self._boat_x, self._boat_y, wind_lift.size, wind_lift.angle,
                              arcade.color.PURPLE, 5, "Wind lift")
         if self._help_mode == HelpModes.ALL:
-            self._draw_arrow(self._boat_x, self._boat_y, self._water_drag.size, self._water_drag.angle,
+            water_drag, water_lift = self._water_drag, self._water_lift
+            self._draw_arrow(self._boat_x, self._boat_y, water_drag.size, water_drag.angle,
                              arcade.color.SILVER, 5, "Water drag")
-            self._draw_arrow(self._boat_x, self._boat_y, self._water_lift.size, self._water_lift.angle,
+            self._draw_arrow(self._boat_x, self._boat_y, water_lift.size, water_lift.angle,
                              arcade.color.YELLOW, 5, "Water lift")
+            self._draw_best_sail_hint()
+
+    def _draw_best_sail_hint(self):
+        """
+        Draws thin lines where the sail and keel should be to sail fastest in the current direction of movement.
+        """
+        # The polar is solved in the background from the first frame showing the hint, a frame never waits for it
+        if self._speed_polar_future is None:
+            self._prefetch_speed_polar()
+        if math.hypot(self._speed_x, self._speed_y) < 1 or not self._speed_polar_future.done():
+            return
+        speed, sail_angle, _, keel_angle = self.speed_polar.best(self._wind_angle,
+                                                                 math.atan2(self._speed_y, self._speed_x))
+        if speed == 0:
+            return
+        arcade.draw_line(self._boat_x, self._boat_y, self._boat_x + math.cos(sail_angle) * self._mast_length,
+                         self._boat_y + math.sin(sail_angle) * self._mast_length, arcade.color.WHITE, 1)
+        if self._stage.has_keel:
+            arcade.draw_line(self._boat_x, self._boat_y, self._boat_x + math.cos(keel_angle) * self._keel_length,
+                             self._boat_y + math.sin(keel_angle) * self._keel_length, arcade.color.DARK_BROWN, 1)
 
     def _draw_boat(self):
         if self._stage.has_keel:
@@ -160,10 +264,10 @@ class Pirates(arcade.Window):
         center_x = self._wind_arrow_length * 2
         center_y = self.height - self._wind_arrow_length * 2
         arcade.draw_circle_outline(center_x, center_y, self._wind_arrow_length / 1.5, arcade.color.MEDIUM_TURQUOISE)
-        self._draw_arrow(center_x, center_y, self._wind_arrow_length, self._wind_angle, arcade.color.METALLIC_SUNBURST, 5)
+        length = self._wind_arrow_length * self._wind_speed / self._base_wind_speed
+        self._draw_arrow(center_x, center_y, length, self._wind_angle, arcade.color.METALLIC_SUNBURST, 5)
 
-    @staticmethod
-    def _draw_arrow(center_x, center_y, length, angle, color, width, text=""):
+    def _draw_arrow(self, center_x, center_y, length, angle, color, width, text=""):
         arcade.draw_line(center_x + (length / 2) * math.cos(angle),
                          center_y + (length / 2) * math.sin(angle),
                          center_x - (length / 2) * math.cos(angle),
@@ -177,258 +281,213 @@ class Pirates(arcade.Window):
                                     center_y + (length / 3) * math.sin(angle + math.pi / 8),
                                     color)
 
-        arcade.draw_text(text,
+        self._texts.draw(text,
                          center_x + (length / 2) * math.cos(angle) + 3,
                          center_y + (length / 2) * math.sin(angle) + 3,
                          color)
 
     def _draw_waves(self):
+        self._wave_shapes.draw()
 
-        onscreen_waves_x = self._wave_x_coords[(self._location_x - (self.width / 2) < self._wave_x_coords) &
-                                               (self._wave_x_coords < self._location_x + (self.width / 2))]
-        onscreen_waves_y = self._wave_y_coords[(self._location_y - (self.height / 2) < self._wave_y_coords) &
-                                               (self._wave_y_coords < self._location_y + (self.height / 2))]
-
-        for x_coord in onscreen_waves_x:
-            for y_coord in onscreen_waves_y:
-                arcade.draw_circle_filled(x_coord - (self._location_x - (self.width / 2)),
-                                          y_coord - (self._location_y - (self.height / 2)),
-                                          5, arcade.color.WHITE_SMOKE)
+    def _draw_ocean(self):
+        if self._ocean is None:
+            return
+        left = self._draw_location_x - self.width / 2
+        bottom = self._draw_location_y - self.height / 2
+        for chunk in self._ocean.chunks_in_rect(left, bottom, left + self.width, bottom + self.height):
+            self._chunk_shapes[chunk.key].draw()
+            for text, text_x, text_y in chunk.texts:
+                self._texts.draw(text, text_x, text_y, arcade.color.BLACK, 20)
+
+    def _draw_wind_field(self):
+        """
+        Draws a streak on a map-aligned grid over the screen, as long as the wind there is strong, all in one batch.
+        """
+        if self._wind_field is None:
+            return
+        left = math.floor((self._draw_location_x - self.width / 2) / WIND_FIELD_SPACING) * WIND_FIELD_SPACING
+        bottom = math.floor((self._draw_location_y - self.height / 2) / WIND_FIELD_SPACING) * WIND_FIELD_SPACING
+        grid_x, grid_y = (grid.ravel() for grid in np.meshgrid(
+            np.arange(left, left + self.width + WIND_FIELD_SPACING * 2, WIND_FIELD_SPACING),
+            np.arange(bottom, bottom + self.height + WIND_FIELD_SPACING * 2, WIND_FIELD_SPACING)))
+        angles, speeds = self._wind_field.sample(grid_x, grid_y, self._game_clock.time)
+        lengths = speeds / self._base_wind_speed * (WIND_FIELD_SPACING / 4)
+        points = np.empty((len(grid_x) * 2, 2))
+        points[0::2, 0] = grid_x - np.cos(angles) * lengths
+        points[0::2, 1] = grid_y - np.sin(angles) * lengths
+        points[1::2, 0] = grid_x + np.cos(angles) * lengths
+        points[1::2, 1] = grid_y + np.sin(angles) * lengths
+        arcade.draw_lines(points.tolist(), arcade.color.LIGHT_BLUE, 2)
+
+    def _draw_route(self):
+        if self._autopilot is None or not self._autopilot.route:
+            return
+        points = []
+        for leg in self._autopilot.route:
+            points += [(leg.start_x, leg.start_y), (leg.end_x, leg.end_y)]
+        arcade.draw_lines(points, arcade.color.LIGHT_YELLOW, 1)
+
+    def _on_ocean_chunk_loaded(self, chunk):
+        shapes = arcade.ShapeElementList()
+        for wave_x, wave_y in zip(chunk.wave_x.tolist(), chunk.wave_y.tolist()):
+            shapes.append(arcade.create_ellipse_filled(wave_x, wave_y, 10, 10, arcade.color.WHITE_SMOKE))
+        for island_x, island_y, island_radius in zip(chunk.island_x.tolist(), chunk.island_y.tolist(),
+                                                     chunk.island_radius.tolist()):
+            shapes.append(arcade.create_ellipse_filled(island_x, island_y, island_radius, island_radius,
+                                                       arcade.color.SAND))
+            shapes.append(arcade.create_ellipse_filled(island_x, island_y, island_radius * 0.7, island_radius * 0.7,
+                                                       arcade.color.FERN_GREEN))
+        self._chunk_shapes[chunk.key] = shapes
+
+    def _on_ocean_chunk_evicted(self, chunk):
+        del self._chunk_shapes[chunk.key]
+
+    def _build_wave_shapes(self):
+        self._wave_shapes = arcade.ShapeElementList()
+        for x_coord in self._wave_x_coords:
+            for y_coord in self._wave_y_coords:
+                self._wave_shapes.append(arcade.create_ellipse_filled(x_coord, y_coord, 10, 10,
+                                                                      arcade.color.WHITE_SMOKE))
 
     def _draw_borders(self):
-        relative_x = self._stage.map_width - self._location_x
+        if self._ocean is not None:
+            return
+        relative_x = self._stage.map_width - self._draw_location_x
         if relative_x < (self.width / 2):
             arcade.draw_xywh_rectangle_filled((self.width / 2) + relative_x, 0, (self.width / 2) - relative_x,
                                               self.height, arcade.color.DARK_BROWN)
-        if self._location_x < (self.width / 2):
-            arcade.draw_xywh_rectangle_filled(0, 0, (self.width / 2) - self._location_x, self.height,
+        if self._draw_location_x < (self.width / 2):
+            arcade.draw_xywh_rectangle_filled(0, 0, (self.width / 2) - self._draw_location_x, self.height,
                                               arcade.color.DARK_BROWN)
-        relative_y = self._stage.map_height - self._location_y
+        relative_y = self._stage.map_height - self._draw_location_y
         if relative_y < (self.height / 2):
             arcade.draw_xywh_rectangle_filled(0, (self.height / 2) + relative_y, self.width,
                                               (self.height / 2) - relative_y, arcade.color.DARK_BROWN)
-        if self._location_y < (self.height / 2):
-            arcade.draw_xywh_rectangle_filled(0, 0, self.width, (self.height / 2) - self._location_y,
+        if self._draw_location_y < (self.height / 2):
+            arcade.draw_xywh_rectangle_filled(0, 0, self.width, (self.height / 2) - self._draw_location_y,
                                               arcade.color.DARK_BROWN)
 
-    def update(self, delta_time):
-        if not self._is_started:
-            return
-        elif self._stage.end_condition(self):
-            self._end_stage()
-            return
-
-        self._sail_angle = self._cap_angle(self._sail_angle + self._sail_angle_delta * delta_time)
-        self._sail_openness = np.clip(self._sail_openness + self._sail_openness_delta * delta_time, 0, 1)
-        if self._stage.has_keel:
-            self._keel_angle = self._cap_angle(self._keel_angle + self._keel_angle_delta * delta_time)
-
-        self._speed_x, self._speed_y = self._calculate_speed()
-        self._location_x = np.clip(self._location_x + self._speed_x * delta_time * 10, 20, self._stage.map_width - 20)
-        self._location_y = np.clip(self._location_y + self._speed_y * delta_time * 10, 20, self._stage.map_height - 20)
-
-        if self._stage.has_litter:
-            self._spawn_litter()
-            self._litter_interaction()
-
-    def _litter_interaction(self):
-        for litter in self._litters:
-            if math.dist(litter, (self._location_x, self._location_y)) < self._reach_distance:
-                self._litters.remove(litter)
-                self._last_collect_time = time.time()
-                self._score += 100
-
-    def _spawn_litter(self):
-        if time.time() - self._last_spawn_time > self._stage.litter_spawn_rate:
-            litter = (random.random() * self._stage.map_width, random.random() * self._stage.map_height)
-            self._litters.append(litter)
-            self._last_spawn_time = time.time()
-
-    @staticmethod
-    def _cap_angle(angle):
-        if angle > math.pi * 2:
-            angle -= math.pi * 2
-        elif angle < 0:
-            angle += math.pi * 2
-        return angle
-
-    def _calculate_speed(self):
-        apparent_wind_x = self._wind_speed * math.cos(self._wind_angle) - self._speed_x
-        apparent_wind_y = self._wind_speed * math.sin(self._wind_angle) - self._speed_y
-        apparent_wind_angle = math.atan2(apparent_wind_y, apparent_wind_x)
-        apparent_wind_speed = math.sqrt(apparent_wind_x ** 2 + apparent_wind_y ** 2)
-        wind_drag_x, wind_drag_y, wind_lift_x, wind_lift_y = self._get_lift_and_drag(apparent_wind_angle,
-                                                                                     apparent_wind_speed,
-                                                                                     self._sail_angle,
-                                                                                     self._sail_openness ** 2)
-
-        water_angle = math.atan2(-self._speed_y, -self._speed_x)
-        water_speed = math.sqrt(self._speed_x ** 2 + self._speed_y ** 2)
-        if self._stage.has_keel:
-            water_drag_x, water_drag_y, water_lift_x, water_lift_y = self._get_lift_and_drag(water_angle, water_speed, self._keel_angle)
+    def on_update(self, delta_time):
+        # The game advances in update, which RemotePirates replaces, so stages are prepared in this separate hook
+        if self._is_intro_drawn and not self._is_stage_prepared:
+            self._prepare_stage()
+
+    def _on_stage_loaded(self):
+        """
+        Only lays out the intro of the stage, so it is drawn on the very next frame. The rest of the stage is prepared
+        in the update after that, while the intro is shown, so starting it is still instant.
+        """
+        self._texts.clear()
+        self._prepare_intro_text()
+        self._is_intro_drawn = False
+        self._is_stage_prepared = False
+
+    def _prepare_stage(self):
+        """
+        Builds the waves and lays out the texts of the stage.
+        """
+        if self._stage.ocean is None:
+            self._wave_x_coords = np.arange(0, self._stage.map_width, self._wave_margin)
+            self._wave_y_coords = np.arange(0, self._stage.map_height, self._wave_margin)
         else:
-            water_drag_x, water_drag_y, water_lift_x, water_lift_y = [0, 0, 0, 0]
-
-        self._wind_drag = Force.from_cartesian(wind_drag_x, wind_drag_y)
-        self._wind_lift = Force.from_cartesian(wind_lift_x, wind_lift_y)
-        self._water_drag = Force.from_cartesian(water_drag_x, water_drag_y)
-        self._water_lift = Force.from_cartesian(water_lift_x, water_lift_y)
-
-        total_force_x = (wind_drag_x + wind_lift_x + water_drag_x + water_lift_x) / 100
-        total_force_y = (wind_drag_y + wind_lift_y + water_drag_y + water_lift_y) / 100
-
-        # Add friction
-        total_force_x -= self._speed_x / 10
-        total_force_y -= self._speed_y / 10
-
-        return self._speed_x + total_force_x, self._speed_y + total_force_y
-
-    def _get_lift_and_drag(self, resistance_angle, resistance_speed, wing_angle, gating=1):
-        attack_angle = resistance_angle - wing_angle + math.pi
-        if attack_angle > math.pi:
-            attack_angle -= math.pi * 2
-        elif attack_angle < -math.pi:
-            attack_angle += math.pi * 2
-        drag_x = (resistance_speed ** 2) * drag_coef(abs(attack_angle)) * math.cos(resistance_angle) * gating
-        drag_y = (resistance_speed ** 2) * drag_coef(abs(attack_angle)) * math.sin(resistance_angle) * gating
-        lift_x = (resistance_speed ** 2) * lift_coef(abs(attack_angle)) * \
-                 math.cos(resistance_angle + math.copysign(math.pi / 2, attack_angle)) * gating
-        lift_y = (resistance_speed ** 2) * lift_coef(abs(attack_angle)) * \
-                 math.sin(resistance_angle + math.copysign(math.pi / 2, attack_angle)) * gating
-        return [self._cap_to_wind_speed(i) for i in [drag_x, drag_y, lift_x, lift_y]]
-
-    def _cap_to_wind_speed(self, speed):
-        return math.copysign(min(abs(speed), abs(self._wind_speed * 10)), speed)
+            # The waves of an endless ocean come with its chunks
+            self._wave_x_coords = self._wave_y_coords = []
+        self._build_wave_shapes()
+        for text in self._stage.stage_texts:
+            self._texts.prepare(text.text, text.location_x, text.location_y, font_size=text.size, **text.kwargs)
+        self._is_stage_prepared = True
+
+    def _on_stage_started(self):
+        if not self._is_stage_prepared:
+            self._prepare_stage()
+        self._chunk_shapes = {}
+        self._litter_sprites = arcade.SpriteList()
+        self._litter_sprite_by_id = {}
+        self._fleet_sprites = arcade.SpriteList()
+        self._shown_fleet_sprites = 0
+        self._drawn_rank = None
+
+    def _on_litter_spawned(self, litter_id, litter_x, litter_y):
+        litter_sprite = arcade.SpriteCircle(8, arcade.color.BULGARIAN_ROSE)
+        litter_sprite.center_x = litter_x
+        litter_sprite.center_y = litter_y
+        self._litter_sprites.append(litter_sprite)
+        self._litter_sprite_by_id[litter_id] = litter_sprite
+
+    def _on_litter_collected(self, litter_id):
+        self._litter_sprite_by_id.pop(litter_id).remove_from_sprite_lists()
+
+    def _on_litter_despawned(self, litter_id):
+        self._litter_sprite_by_id.pop(litter_id).remove_from_sprite_lists()
 
     def on_key_press(self, symbol: int, modifiers: int):
-        if not self._is_started and not self._is_finished:
-            if symbol == arcade.key.SPACE:
-                self._start_stage()
+        if symbol == keys.P:
+            self._toggle_profiler()
             return
-
-        if symbol == arcade.key.RIGHT:
-            self._sail_angle_delta = -self._sail_move_speed
-        elif symbol == arcade.key.LEFT:
-            self._sail_angle_delta = self._sail_move_speed
-        elif symbol == arcade.key.UP:
-            self._sail_openness_delta = self._sail_open_speed
-        elif symbol == arcade.key.DOWN:
-            self._sail_openness_delta = -self._sail_open_speed
-        elif symbol == arcade.key.D:
-            self._keel_angle_delta = -self._keel_move_speed
-        elif symbol == arcade.key.A:
-            self._keel_angle_delta = self._keel_move_speed
-        elif symbol == arcade.key.H:
-            self._help_mode = HelpModes((self._help_mode.value + 1) % len(HelpModes))
-
-    def _start_stage(self):
-        self._location_x = self._stage.boat_init_params.location_x
-        self._location_y = self._stage.boat_init_params.location_y
-        self._sail_angle = self._stage.boat_init_params.sail_angel
-        self._sail_openness = self._stage.boat_init_params.sail_openness
-        self._wave_x_coords = np.arange(0, self._stage.map_width, self._wave_margin)
-        self._wave_y_coords = np.arange(0, self._stage.map_height, self._wave_margin)
-        self._litters = []
-        self._last_spawn_time = 0
-        self._last_collect_time = 0
-        self._score = 0
-        self._is_started = True
-
-    def _end_stage(self):
-        self._is_started = False
-        self._stage_index += 1
-        if self._stage_index < len(self._stages):
-            self._stage = self._stages[self._stage_index]
-        else:
-            self._is_finished = True
-
-    def on_key_release(self, symbol: int, modifiers: int):
-        if symbol in [arcade.key.RIGHT, arcade.key.LEFT]:
-            self._sail_angle_delta = 0
-        elif symbol in [arcade.key.UP, arcade.key.DOWN]:
-            self._sail_openness_delta = 0
-        elif symbol in [arcade.key.A, arcade.key.D]:
-            self._keel_angle_delta = 0
-
-    def is_at_the_end_of_horizontal_stage(self):
-        return self._location_x > self._stage.map_width * 9 / 10
-
-    def is_at_the_end_of_vertical_stage(self):
-        return self._location_y > self._stage.map_height * 9 / 10
-
-    def is_at_the_start_of_horizontal_stage(self):
-        return self._location_x < self._stage.map_width / 10
-
-    def is_score_enough(self):
-        return self._score >= 1000
-
-
-def main():
-    stage1_texts = [
-        OnscreenText(heb("השתמשו בחצים ימינה ושמאלה כדי להזיז את המפרש"), -SCREEN_WIDTH / 10, SCREEN_HEIGHT * 2.3 / 4, 20),
-        OnscreenText(heb("יופי! המשיכו הלאה!"), SCREEN_WIDTH * 2, SCREEN_HEIGHT * 2.3 / 4, 20),
-    ]
-    stage1 = Stage(SCREEN_WIDTH * 4, SCREEN_HEIGHT / 2, BoatInitParams(SCREEN_WIDTH / 10, SCREEN_HEIGHT / 4), False,
-                    False, heb("ברוכים הבאים למשחק!", "במשחק זה תלמדו להשיט סירת מפרש", "לחצו רווח כדי להתחיל"), stage1_texts,
-                    Pirates.is_at_the_end_of_horizontal_stage)
-    stage2_texts = [
-        OnscreenText(heb("השתמשו בחצים למעלה ולמטה כדי לפתוח/לסגור את המפרש"), -SCREEN_WIDTH / 10, SCREEN_HEIGHT * 2.3 / 4, 20),
-    ]
-    stage2 = Stage(SCREEN_WIDTH * 3, SCREEN_HEIGHT / 2, BoatInitParams(SCREEN_WIDTH / 10, SCREEN_HEIGHT / 4, 0, math.pi / 2),
-                   False, False, heb("כל הכבוד!", "לחצו רווח כדי להמשיך לשלב הבא"), stage2_texts,
-                   Pirates.is_at_the_end_of_horizontal_stage)
-    stage3_texts = [
-        OnscreenText(heb("לחצו על A ו-D כדי להזיז את הסנפיר"), -SCREEN_WIDTH / 10, SCREEN_HEIGHT * 2.3 / 4, 20),
-        OnscreenText(heb("נסו לאסוף את הליכלוך!"), SCREEN_WIDTH * 1.5, SCREEN_HEIGHT * 2.3 / 4, 20),
-    ]
-    stage3 = Stage(SCREEN_WIDTH * 6, SCREEN_HEIGHT / 2, BoatInitParams(SCREEN_WIDTH / 10, SCREEN_HEIGHT / 4), True,
-                   True, heb("אחלה!", "עכשיו נכיר חלק נוסף של הסירה: הסנפיר"), stage3_texts,
-                   Pirates.is_at_the_end_of_horizontal_stage, 1.5)
-    stage4_texts = [
-        OnscreenText(heb("נסו לזוז למעלה!",
-                     "מקמו את הסנפיר למטה, ",
-                     # Since the text is reversed, we write 54 so it'll be written as 45
-                     "ושימו את המפרש בזווית של 54 מעלות עם הרוח"),
-                     0, -SCREEN_HEIGHT / 8, 20, multiline=True, width=SCREEN_WIDTH / 2),
-        OnscreenText(heb("אתם על זה!"), SCREEN_WIDTH * 4 / 10, SCREEN_HEIGHT * 1.5, 20),
-    ]
-    stage4 = Stage(SCREEN_WIDTH / 3, SCREEN_HEIGHT * 3, BoatInitParams(SCREEN_WIDTH / 6, SCREEN_HEIGHT / 10), True,
-                   False, heb("לזוז בכוון הרוח זה קל", "עכשיו ננסה לזוז במאונך לרוח"), stage4_texts,
-                   Pirates.is_at_the_end_of_vertical_stage)
-    stage5_texts = [
-        OnscreenText(heb("מקמו את הסנפיר למטה, ",
-                         # Since the text is reversed, we write 54 so it'll be written as 45
-                         "ושימו את המפרש בזווית של 54 מעלות עם הרוח"),
-                     0, -SCREEN_HEIGHT / 8, 20, multiline=True, width=SCREEN_WIDTH / 2),
-        OnscreenText(heb("השתמשו בסנפיר כדי לכוון"), SCREEN_WIDTH * 4 / 10, SCREEN_HEIGHT * 1.5, 20),
-    ]
-    stage5 = Stage(SCREEN_WIDTH / 3, SCREEN_HEIGHT * 6, BoatInitParams(SCREEN_WIDTH / 6, SCREEN_HEIGHT / 10), True,
-                   True, heb("יפה מאוד!", "עכשיו נסו לאסוף לכלוך תוך כדי"), stage5_texts,
-                   Pirates.is_at_the_end_of_vertical_stage, 1.5)
-    stage6_texts = [
-        OnscreenText(heb("נסו לעלות לרוח!",
-                         "תוך כדי שאתם זזים למעלה כמו שלמדתם,",
-                         "הזיזו את הסנפיר מעט ימינה"),
-                     SCREEN_WIDTH * 2, 0, 20, multiline=True, width=SCREEN_WIDTH / 2),
-        OnscreenText(heb("נסו לעלות לרוח!",
-                         "תוך כדי שאתם זזים למטה כמו שלמדתם,",
-                         "הזיזו את הסנפיר מעט שמאלה"),
-                     SCREEN_WIDTH * 2, SCREEN_HEIGHT, 20, multiline=True, width=SCREEN_WIDTH / 2),
-        OnscreenText(heb("לא להתייאש, אתם כמעט שם!"), SCREEN_WIDTH, SCREEN_HEIGHT / 2, 20, color=arcade.color.BLACK)
-    ]
-    stage6 = Stage(SCREEN_WIDTH * 2, SCREEN_HEIGHT, BoatInitParams(SCREEN_WIDTH * 1.9, SCREEN_HEIGHT / 10), True,
-                   False, heb("מעולה!", "עכשיו ננסה לזוז כנגד הרוח"), stage6_texts,
-                   Pirates.is_at_the_start_of_horizontal_stage)
-    stage7 = Stage(SCREEN_WIDTH * 2, SCREEN_HEIGHT * 2, BoatInitParams(SCREEN_WIDTH, SCREEN_HEIGHT), True,
-                   True, heb("מדהים! אתם מלחים של ממש עכשיו", "בשלב הבא נסו לאסוף כמה שיותר לכלוך"), [],
-                   Pirates.is_score_enough, 7)
-    game = Pirates(SCREEN_WIDTH, SCREEN_HEIGHT, [stage1, stage2, stage3, stage4, stage5, stage6, stage7])
+        super().on_key_press(symbol, modifiers)
+
+    def on_close(self):
+        if self._input_recorder is not None:
+            self._input_recorder.save(self)
+        if self._telemetry is not None:
+            self._telemetry.close()
+        if self._profile_dump_path is not None:
+            self._profiler.dump(self._profile_dump_path)
+        super().on_close()
+
+
+def create_game(record_path=None, profile_dump_path=None, regatta_size=None, stages_path=None, is_ocean=False,
+                is_demo=False, telemetry_path=None, visible=True):
+    """
+    Opens the game window. Every optional subsystem is only imported when its option is used, like the autopilot
+    with the route planner it brings along.
+    """
+    seed = random.randrange(2 ** 32)
+    input_recorder = None
+    if record_path:
+        from replay import InputRecorder
+        input_recorder = InputRecorder(seed, record_path, regatta_size, stages_path, is_ocean)
+    telemetry = None
+    if telemetry_path:
+        from telemetry import TelemetryRecorder
+        telemetry = TelemetryRecorder(telemetry_path, {"seed": seed, "regatta_size": regatta_size,
+                                                       "stages_path": stages_path, "is_ocean": is_ocean,
+                                                       "is_demo": is_demo})
+    if is_ocean:
+        stages = [create_ocean_stage()]
+    elif regatta_size:
+        stages = [create_regatta_stage(regatta_size)]
+    elif stages_path:
+        from stage_loader import StagePack
+        stages = StagePack(stages_path)
+    else:
+        stages = create_stages()
+    autopilot = None
+    if is_demo:
+        from controllers import AutopilotController
+        autopilot = AutopilotController(start_delay=DEMO_START_DELAY)
+    return Pirates(SCREEN_WIDTH, SCREEN_HEIGHT, stages, profile_dump_path, visible, seed=seed,
+                   input_recorder=input_recorder, autopilot=autopilot, telemetry=telemetry)
+
+
+def main(record_path=None, profile_dump_path=None, regatta_size=None, stages_path=None, is_ocean=False,
+         is_demo=False, telemetry_path=None):
+    create_game(record_path, profile_dump_path, regatta_size, stages_path, is_ocean, is_demo, telemetry_path)
     arcade.run()
 
 
-def heb(*texts):
-    return "\n".join("".join(reversed(text)) for text in texts)
-
-
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", help="save the played session to this file, to be replayed by replay.py")
+    parser.add_argument("--profile-dump", help="save the frame profiler percentiles (toggled with P) to this file")
+    parser.add_argument("--regatta", type=int, metavar="BOATS",
+                        help="play a single litter race against this many AI boats instead of the lessons")
+    parser.add_argument("--stages", help="play the lessons of this stage pack file instead of the default ones")
+    parser.add_argument("--ocean", action="store_true", help="sail freely on an endless ocean instead of the lessons")
+    parser.add_argument("--demo", action="store_true", help="let the autopilot sail, drawing the route it plans")
+    parser.add_argument("--telemetry",
+                        help="stream the boat state and forces of every tick to this file, to be read by telemetry.py")
+    args = parser.parse_args()
+    if args.demo and args.record:
+        parser.error("--record only records keys, so autopilot sessions cannot be replayed")
+    main(args.record, args.profile_dump, args.regatta, args.stages, args.ocean, args.demo, args.telemetry)
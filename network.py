@@ -0,0 +1,172 @@
+"""
+Wire format shared by server.py and remote_client.py. Messages are json lines. After a welcome message with the
+player id, the server sends one state update per tick, holding only what changed since the previous update it sent
+to that client. Since the connection is reliable and ordered, the previous update is always known to have arrived.
+Entities are keyed "b<player id>" for boats and "l<litter id>" for litter. Their values are quantized to integers, so
+an entity that moved a bit is sent as a few small differences.
+"""
+import bisect
+import collections
+import json
+import math
+import threading
+import time
+
+POSITION_SCALE = 8
+ANGLE_STEPS = 1 << 16
+OPENNESS_STEPS = 255
+BOAT_PREFIX = "b"
+LITTER_PREFIX = "l"
+
+
+def encode_message(message):
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+def decode_message(data, fields_count=None):
+    """
+    :param fields_count: the number of fields of a message sent as a list, like the key events of the clients
+    :raise ValueError: if data is not json, or not a list of fields_count fields when it is given
+    """
+    message = json.loads(data)
+    if fields_count is not None and (not isinstance(message, list) or len(message) != fields_count):
+        raise ValueError("Expected a list of {} fields, got {!r}".format(fields_count, message))
+    return message
+
+
+def _quantize_angle(angle):
+    return round(angle / (math.pi * 2) * ANGLE_STEPS) % ANGLE_STEPS
+
+
+def _dequantize_angle(value):
+    return value / ANGLE_STEPS * (math.pi * 2)
+
+
+def quantize_boat(boat_state):
+    return (round(boat_state.location_x * POSITION_SCALE), round(boat_state.location_y * POSITION_SCALE),
+            _quantize_angle(boat_state.sail_angle), round(boat_state.sail_openness * OPENNESS_STEPS),
+            _quantize_angle(boat_state.keel_angle))
+
+
+def quantize_litter(litter_x, litter_y):
+    return round(litter_x * POSITION_SCALE), round(litter_y * POSITION_SCALE)
+
+
+def dequantize(key, values):
+    """
+    :return: (x, y) for litter, (x, y, sail angle, sail openness, keel angle) for boats
+    """
+    if key.startswith(LITTER_PREFIX):
+        return values[0] / POSITION_SCALE, values[1] / POSITION_SCALE
+    return (values[0] / POSITION_SCALE, values[1] / POSITION_SCALE, _dequantize_angle(values[2]),
+            values[3] / OPENNESS_STEPS, _dequantize_angle(values[4]))
+
+
+def encode_delta(previous, current):
+    """
+    :param previous: {key: quantized values} last sent to the client
+    :param current: {key: quantized values} to be sent now
+    :return: {"new": {key: values}, "changed": {key: differences}, "removed": [keys]}, empty parts left out
+    """
+    delta = {}
+    new = {}
+    changed = {}
+    for key, values in current.items():
+        previous_values = previous.get(key)
+        if previous_values is None:
+            new[key] = values
+        elif previous_values != values:
+            changed[key] = [value - previous_value for value, previous_value in zip(values, previous_values)]
+    removed = [key for key in previous if key not in current]
+    if new:
+        delta["new"] = new
+    if changed:
+        delta["changed"] = changed
+    if removed:
+        delta["removed"] = removed
+    return delta
+
+
+def apply_delta(state, delta):
+    """
+    :return: the state after the delta, state itself is left as it was
+    """
+    state = dict(state)
+    for key in delta.get("removed", ()):
+        del state[key]
+    for key, differences in delta.get("changed", {}).items():
+        state[key] = tuple(value + difference for value, difference in zip(state[key], differences))
+    for key, values in delta.get("new", {}).items():
+        state[key] = tuple(values)
+    return state
+
+
+def _interpolate_angle(start, end, fraction):
+    return start + (math.remainder(end - start, math.pi * 2)) * fraction
+
+
+def _interpolate(key, start, end, fraction):
+    if key.startswith(LITTER_PREFIX):
+        return end
+    return (start[0] + (end[0] - start[0]) * fraction, start[1] + (end[1] - start[1]) * fraction,
+            _interpolate_angle(start[2], end[2], fraction), start[3] + (end[3] - start[3]) * fraction,
+            _interpolate_angle(start[4], end[4], fraction))
+
+
+class ClientState:
+    """
+    The client side of the protocol: rebuilds the state from the deltas and keeps the last few states with their
+    arrival times, to draw the boats smoothly between the server ticks a fixed delay behind them.
+    Received from the network thread and sampled from the drawing thread.
+    """
+    def __init__(self, interpolation_delay=0.1, history_size=32):
+        self.player_id = None
+        self.bytes_received = 0
+        self._interpolation_delay = interpolation_delay
+        self._game = {}
+        self._entities = {}
+        self._times = collections.deque(maxlen=history_size)
+        self._history = collections.deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    def receive(self, data):
+        message = decode_message(data)
+        with self._lock:
+            self.bytes_received += len(data)
+            if "player_id" in message:
+                self.player_id = message["player_id"]
+                return
+            self._game.update(message.get("game", {}))
+            self._entities = apply_delta(self._entities, message)
+            self._times.append(time.perf_counter())
+            self._history.append(self._entities)
+
+    def sample(self, now=None):
+        """
+        :return: game fields ({} before the first update) and {key: dequantized values} as seen interpolation_delay
+        ago
+        """
+        game, start, end, fraction = self._bracketing_states(now)
+        end = {key: dequantize(key, values) for key, values in end.items()}
+        if start is None:
+            return game, end
+        return game, {key: _interpolate(key, dequantize(key, start[key]), values, fraction) if key in start
+                      else values for key, values in end.items()}
+
+    def _bracketing_states(self, now):
+        """
+        :return: game fields, the quantized states before and after the render time and how far between them it is,
+        the state before being None when there is nothing to interpolate
+        """
+        render_time = (time.perf_counter() if now is None else now) - self._interpolation_delay
+        with self._lock:
+            game = dict(self._game)
+            if not self._history:
+                return game, None, {}, 0
+            index = bisect.bisect_right(self._times, render_time)
+            if index == 0:
+                return game, None, self._history[0], 0
+            if index == len(self._times):
+                return game, None, self._history[-1], 0
+            fraction = (render_time - self._times[index - 1]) / (self._times[index] - self._times[index - 1])
+            return game, self._history[index - 1], self._history[index], fraction
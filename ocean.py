@@ -0,0 +1,209 @@
+import collections
+import math
+
+import numpy as np
+
+WAVE_SPACING = 130
+WAVE_JITTER = 25
+BOAT_RADIUS = 20
+
+
+class OceanSettings:
+    """
+    Makes a stage an endless ocean, generated in square chunks of chunk_size around the boat.
+    :param prefetch_radius: chunks this many chunks away from the boat are generated ahead of time,
+    max_chunks_per_update at a time so crossing into new water never costs a frame more than that
+    :param max_chunks: chunks kept loaded, the least recently used chunks beyond it are dropped and generated again if
+    the boat comes back. Chunks are counted rather than measured, as the shapes drawing a chunk take far more memory
+    than its generated data
+    :param forget_radius: collected litter is only remembered for chunks this many chunks from the boat, further away
+    the ocean fills up again
+    """
+    def __init__(self, texts=(), chunk_size=1300, litter_per_chunk=2, max_islands_per_chunk=2,
+                 island_radius_range=(40, 160), text_chance=0.15, prefetch_radius=2, max_chunks_per_update=1,
+                 max_chunks=49, forget_radius=8):
+        self.texts = texts
+        self.chunk_size = chunk_size
+        self.litter_per_chunk = litter_per_chunk
+        self.max_islands_per_chunk = max_islands_per_chunk
+        self.island_radius_range = island_radius_range
+        self.text_chance = text_chance
+        self.prefetch_radius = prefetch_radius
+        self.max_chunks_per_update = max_chunks_per_update
+        self.max_chunks = max_chunks
+        self.forget_radius = forget_radius
+
+
+class OceanChunk:
+    def __init__(self, key, left, bottom, wave_x, wave_y, island_x, island_y, island_radius, litter_x, litter_y,
+                 texts):
+        self.key = key
+        self.left = left
+        self.bottom = bottom
+        self.wave_x = wave_x
+        self.wave_y = wave_y
+        self.island_x = island_x
+        self.island_y = island_y
+        self.island_radius = island_radius
+        self.litter_x = litter_x
+        self.litter_y = litter_y
+        self.texts = texts
+        self.litter_ids = set()
+
+
+def _zigzag(value):
+    """
+    Maps the integers to the non negative ones one to one, as seeds must not be negative.
+    """
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def generate_chunk(settings, seed, column, row, clear_x, clear_y):
+    """
+    Generates the same chunk for the same seed every time.
+    :param clear_x, clear_y: a point kept free of islands, where the boat starts
+    """
+    rng = np.random.default_rng([seed, _zigzag(column), _zigzag(row)])
+    size = settings.chunk_size
+    left = column * size
+    bottom = row * size
+    wave_x, wave_y = (grid.ravel() for grid in np.meshgrid(np.arange(left, left + size, WAVE_SPACING),
+                                                            np.arange(bottom, bottom + size, WAVE_SPACING)))
+    wave_x = wave_x + rng.uniform(-WAVE_JITTER, WAVE_JITTER, len(wave_x))
+    wave_y = wave_y + rng.uniform(-WAVE_JITTER, WAVE_JITTER, len(wave_y))
+
+    islands_count = rng.integers(0, settings.max_islands_per_chunk + 1)
+    island_radius = rng.uniform(*settings.island_radius_range, islands_count)
+    # Islands are kept away from the chunk edges, so the boat only ever needs to check the islands of its own chunk
+    edge = island_radius + BOAT_RADIUS
+    island_x = left + edge + rng.random(islands_count) * (size - edge * 2)
+    island_y = bottom + edge + rng.random(islands_count) * (size - edge * 2)
+    is_clear = np.hypot(island_x - clear_x, island_y - clear_y) > island_radius + BOAT_RADIUS * 5
+    island_x, island_y, island_radius = island_x[is_clear], island_y[is_clear], island_radius[is_clear]
+
+    litter_x = left + rng.random(settings.litter_per_chunk) * size
+    litter_y = bottom + rng.random(settings.litter_per_chunk) * size
+    is_on_water = np.all(np.hypot(litter_x[:, np.newaxis] - island_x, litter_y[:, np.newaxis] - island_y) >
+                         island_radius + BOAT_RADIUS, axis=1)
+    # Filtered litter is replaced by NaN instead of removed, so litter indices stay stable between generations
+    litter_x = np.where(is_on_water, litter_x, np.nan)
+    litter_y = np.where(is_on_water, litter_y, np.nan)
+
+    texts = []
+    if settings.texts and rng.random() < settings.text_chance:
+        texts.append((settings.texts[rng.integers(len(settings.texts))], left + rng.random() * size,
+                      bottom + rng.random() * size))
+    return OceanChunk((column, row), left, bottom, wave_x, wave_y, island_x, island_y, island_radius, litter_x,
+                      litter_y, texts)
+
+
+class OceanWorld:
+    """
+    The loaded chunks of an ocean, kept in least recently used order. Chunks next to the boat are generated right
+    away and never dropped, further ones are prefetched a few per update.
+    The collected litter is remembered by chunk and index, so chunks generated again come back without it, as long
+    as they are within the forget radius.
+    """
+    def __init__(self, settings, seed, clear_x, clear_y):
+        self._settings = settings
+        self._seed = seed
+        self._clear_x = clear_x
+        self._clear_y = clear_y
+        self._chunks = collections.OrderedDict()
+        self._collected = {}
+        self._litter_chunks = {}
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def chunk_of(self, x, y):
+        return math.floor(x / self._settings.chunk_size), math.floor(y / self._settings.chunk_size)
+
+    def update(self, x, y):
+        """
+        :return: the chunks generated and the chunks dropped by this update
+        """
+        column, row = self.chunk_of(x, y)
+        loaded = [self._load(key) for key in self._chunks_around(column, row, 1) if key not in self._chunks]
+        around = self._chunks_around(column, row, self._settings.prefetch_radius)
+        missing = sorted((key for key in around if key not in self._chunks),
+                         key=lambda key: (key[0] - column) ** 2 + (key[1] - row) ** 2)
+        loaded += [self._load(key) for key in missing[:self._settings.max_chunks_per_update]]
+        for key in around:
+            if key in self._chunks:
+                self._chunks.move_to_end(key)
+
+        evicted = []
+        while len(self._chunks) > self._settings.max_chunks:
+            key = next(iter(self._chunks))
+            if max(abs(key[0] - column), abs(key[1] - row)) <= 1:
+                break
+            evicted.append(self._evict(key))
+        if evicted:
+            self._forget_far_litter(column, row)
+        return loaded, evicted
+
+    def _forget_far_litter(self, column, row):
+        """
+        Drops the collected litter of unloaded chunks far from the boat, so a long voyage does not keep growing it.
+        """
+        radius = self._settings.forget_radius
+        for key in [key for key in self._collected if key not in self._chunks and
+                    max(abs(key[0] - column), abs(key[1] - row)) > radius]:
+            del self._collected[key]
+
+    @staticmethod
+    def _chunks_around(column, row, radius):
+        return [(column + column_offset, row + row_offset) for column_offset in range(-radius, radius + 1)
+                for row_offset in range(-radius, radius + 1)]
+
+    def _load(self, key):
+        chunk = generate_chunk(self._settings, self._seed, key[0], key[1], self._clear_x, self._clear_y)
+        self._chunks[key] = chunk
+        return chunk
+
+    def _evict(self, key):
+        chunk = self._chunks.pop(key)
+        for litter_id in chunk.litter_ids:
+            del self._litter_chunks[litter_id]
+        return chunk
+
+    def uncollected_litter(self, chunk):
+        """
+        :return: (index, x, y) of the litter of the chunk that was not collected yet
+        """
+        return [(index, litter_x, litter_y) for index, (litter_x, litter_y)
+                in enumerate(zip(chunk.litter_x.tolist(), chunk.litter_y.tolist()))
+                if not math.isnan(litter_x) and index not in self._collected.get(chunk.key, ())]
+
+    def attach_litter(self, chunk, index, litter_id):
+        chunk.litter_ids.add(litter_id)
+        self._litter_chunks[litter_id] = (chunk, index)
+
+    def collect_litter(self, litter_id):
+        chunk, index = self._litter_chunks.pop(litter_id)
+        chunk.litter_ids.discard(litter_id)
+        self._collected.setdefault(chunk.key, set()).add(index)
+
+    def chunks_in_rect(self, left, bottom, right, top):
+        min_column, min_row = self.chunk_of(left, bottom)
+        max_column, max_row = self.chunk_of(right, top)
+        return [self._chunks[(column, row)] for column in range(min_column, max_column + 1)
+                for row in range(min_row, max_row + 1) if (column, row) in self._chunks]
+
+    def push_out_of_islands(self, x, y):
+        """
+        :return: the closest location to (x, y) that is not on an island, and whether (x, y) was on one
+        """
+        chunk = self._chunks.get(self.chunk_of(x, y))
+        if chunk is None:
+            return x, y, False
+        for island_x, island_y, island_radius in zip(chunk.island_x.tolist(), chunk.island_y.tolist(),
+                                                     chunk.island_radius.tolist()):
+            distance = math.hypot(x - island_x, y - island_y)
+            reach = island_radius + BOAT_RADIUS
+            if distance < reach:
+                if distance == 0:
+                    return island_x + reach, island_y, True
+                return island_x + (x - island_x) * reach / distance, island_y + (y - island_y) * reach / distance, True
+        return x, y, False
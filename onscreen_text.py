@@ -1,4 +1,8 @@
 
+def heb(*texts):
+    return "\n".join("".join(reversed(text)) for text in texts)
+
+
 class OnscreenText:
     def __init__(self, text, location_x, location_y, size, **kwargs):
         self.text = text
@@ -0,0 +1,196 @@
+import math
+
+import numpy as np
+
+from sail_force import drag_coef, lift_coef, scalar_coefs
+
+FORCE_SCALE = 100
+FRICTION_SCALE = 10
+LOCATION_SCALE = 10
+BORDER_MARGIN = 20
+# The force and friction scales were tuned for steps of this length, speed changes are scaled to the actual step
+BASE_STEP_TIME = 1 / 60
+
+
+def _clip_scalar(value, limit):
+    return min(max(value, -limit), limit)
+
+
+def _clip_array(value, limit):
+    return np.clip(value, -limit, limit)
+
+
+def _analytic_coefs(angle):
+    return drag_coef(angle), lift_coef(angle)
+
+
+# The physics model is written once, against either of these cos, sin, atan2, hypot, copysign and clip. Numpy works on
+# scalars too, but math on floats is much faster for the single boat of a game
+_SCALAR_MATH = (math.cos, math.sin, math.atan2, math.hypot, math.copysign, _clip_scalar)
+_ARRAY_MATH = (np.cos, np.sin, np.arctan2, np.hypot, np.copysign, _clip_array)
+
+
+def _lift_and_drag(functions, coefs, resistance_angle, resistance_speed, wing_angle, max_force, gating):
+    cos, sin, _, _, copysign, clip = functions
+    attack_angle = (resistance_angle - wing_angle) % (math.pi * 2) - math.pi
+    pressure = (resistance_speed ** 2) * gating
+    drag_coefficient, lift_coefficient = coefs(abs(attack_angle))
+    drag = pressure * drag_coefficient
+    lift = pressure * lift_coefficient
+    lift_angle = resistance_angle + copysign(math.pi / 2, attack_angle)
+    max_force = abs(max_force)
+    return (clip(drag * cos(resistance_angle), max_force), clip(drag * sin(resistance_angle), max_force),
+            clip(lift * cos(lift_angle), max_force), clip(lift * sin(lift_angle), max_force))
+
+
+def _forces(functions, coefs, speed_x, speed_y, sail_angle, sail_openness, keel_angle, has_keel, wind_angle,
+            wind_speed):
+    cos, sin, atan2, hypot, _, _ = functions
+    max_force = wind_speed * 10
+    apparent_wind_x = wind_speed * cos(wind_angle) - speed_x
+    apparent_wind_y = wind_speed * sin(wind_angle) - speed_y
+    wind_forces = _lift_and_drag(functions, coefs, atan2(apparent_wind_y, apparent_wind_x),
+                                 hypot(apparent_wind_x, apparent_wind_y), sail_angle, max_force, sail_openness ** 2)
+    if has_keel:
+        water_forces = _lift_and_drag(functions, coefs, atan2(-speed_y, -speed_x), hypot(speed_x, speed_y),
+                                      keel_angle, max_force, 1)
+    else:
+        water_forces = (speed_x * 0,) * 4
+    return wind_forces + water_forces
+
+
+def get_lift_and_drag(resistance_angle, resistance_speed, wing_angle, max_force, gating=1, polar=None):
+    """
+    Works on scalars as well as on arrays of boats.
+    :param polar: optional PolarTable used instead of the analytic drag and lift curves
+    :return: drag_x, drag_y, lift_x, lift_y - each capped to [-max_force, max_force]
+    """
+    return _lift_and_drag(_ARRAY_MATH, _analytic_coefs if polar is None else polar.coefs, resistance_angle,
+                          resistance_speed, wing_angle, max_force, gating)
+
+
+def calculate_forces(speed_x, speed_y, sail_angle, sail_openness, keel_angle, has_keel, wind_angle, wind_speed,
+                     polar=None):
+    """
+    :return: wind_drag_x, wind_drag_y, wind_lift_x, wind_lift_y, water_drag_x, water_drag_y, water_lift_x, water_lift_y
+    """
+    return _forces(_ARRAY_MATH, _analytic_coefs if polar is None else polar.coefs, speed_x, speed_y, sail_angle,
+                   sail_openness, keel_angle, has_keel, wind_angle, wind_speed)
+
+
+class BoatForces:
+    """
+    The cartesian forces on a single boat, overwritten in place every tick instead of allocating new objects.
+    """
+    __slots__ = ("wind_drag_x", "wind_drag_y", "wind_lift_x", "wind_lift_y",
+                 "water_drag_x", "water_drag_y", "water_lift_x", "water_lift_y")
+
+    def __init__(self):
+        self.wind_drag_x = self.wind_drag_y = self.wind_lift_x = self.wind_lift_y = 0.0
+        self.water_drag_x = self.water_drag_y = self.water_lift_x = self.water_lift_y = 0.0
+
+
+def get_scalar_lift_and_drag(resistance_angle, resistance_speed, wing_angle, max_force, gating=1, polar=None):
+    """
+    Same as get_lift_and_drag for a single boat, with math on floats.
+    """
+    return _lift_and_drag(_SCALAR_MATH, scalar_coefs if polar is None else polar.scalar_coefs, resistance_angle,
+                          resistance_speed, wing_angle, max_force, gating)
+
+
+def calculate_scalar_forces(forces, speed_x, speed_y, sail_angle, sail_openness, keel_angle, has_keel, wind_angle,
+                            wind_speed, polar=None):
+    """
+    Same as calculate_forces for a single boat, writing the result into the given BoatForces.
+    """
+    (forces.wind_drag_x, forces.wind_drag_y, forces.wind_lift_x, forces.wind_lift_y,
+     forces.water_drag_x, forces.water_drag_y, forces.water_lift_x, forces.water_lift_y) = _forces(
+        _SCALAR_MATH, scalar_coefs if polar is None else polar.scalar_coefs, speed_x, speed_y, sail_angle,
+        sail_openness, keel_angle, has_keel, wind_angle, wind_speed)
+
+
+def calculate_speed(speed_x, speed_y, forces, delta_time=BASE_STEP_TIME):
+    """
+    Works on scalars as well as on arrays of boats.
+    :param forces: the eight forces, as calculate_forces returns them
+    """
+    total_force_x = (forces[0] + forces[2] + forces[4] + forces[6]) / FORCE_SCALE
+    total_force_y = (forces[1] + forces[3] + forces[5] + forces[7]) / FORCE_SCALE
+
+    # Add friction
+    total_force_x -= speed_x / FRICTION_SCALE
+    total_force_y -= speed_y / FRICTION_SCALE
+
+    step_scale = delta_time / BASE_STEP_TIME
+    return speed_x + total_force_x * step_scale, speed_y + total_force_y * step_scale
+
+
+def calculate_scalar_speed(speed_x, speed_y, forces, delta_time=BASE_STEP_TIME):
+    """
+    Same as calculate_speed for the BoatForces of a single boat.
+    """
+    return calculate_speed(speed_x, speed_y, (forces.wind_drag_x, forces.wind_drag_y, forces.wind_lift_x,
+                                              forces.wind_lift_y, forces.water_drag_x, forces.water_drag_y,
+                                              forces.water_lift_x, forces.water_lift_y), delta_time)
+
+
+class BoatPhysics:
+    """
+    Window-free engine advancing many boats together. Every boat attribute is an array with one cell per boat,
+    so each step is a handful of vectorized numpy operations regardless of the number of boats.
+    """
+    def __init__(self, boats_count, wind_angle=0, wind_speed=50, polar=None):
+        self.boats_count = boats_count
+        self.polar = polar
+        self.wind_angle = wind_angle
+        self.wind_speed = wind_speed
+        self.location_x = np.zeros(boats_count)
+        self.location_y = np.zeros(boats_count)
+        self.speed_x = np.zeros(boats_count)
+        self.speed_y = np.zeros(boats_count)
+        self.sail_angle = np.zeros(boats_count)
+        self.sail_openness = np.ones(boats_count)
+        self.keel_angle = np.full(boats_count, math.pi)
+        self.sail_angle_delta = np.zeros(boats_count)
+        self.sail_openness_delta = np.zeros(boats_count)
+        self.keel_angle_delta = np.zeros(boats_count)
+        self.forces = (np.zeros(boats_count),) * 8
+
+    def reset(self, boat_init_params):
+        self.location_x[:] = boat_init_params.location_x
+        self.location_y[:] = boat_init_params.location_y
+        self.speed_x[:] = 0
+        self.speed_y[:] = 0
+        self.sail_angle[:] = boat_init_params.sail_angel
+        self.sail_openness[:] = boat_init_params.sail_openness
+        self.keel_angle[:] = boat_init_params.keel_angel
+
+    def load_state(self, boat_state):
+        """
+        Puts every boat in the given state, e.g. to simulate alternatives for a single boat in a game.
+        """
+        self.location_x[:] = boat_state.location_x
+        self.location_y[:] = boat_state.location_y
+        self.speed_x[:] = boat_state.speed_x
+        self.speed_y[:] = boat_state.speed_y
+        self.sail_angle[:] = boat_state.sail_angle
+        self.sail_openness[:] = boat_state.sail_openness
+        self.keel_angle[:] = boat_state.keel_angle
+
+    def step(self, delta_time, map_width, map_height, has_keel):
+        # The angles and locations are updated in place, saving the allocation of new arrays for them every step
+        self.sail_angle += self.sail_angle_delta * delta_time
+        np.mod(self.sail_angle, math.pi * 2, out=self.sail_angle)
+        self.sail_openness += self.sail_openness_delta * delta_time
+        np.clip(self.sail_openness, 0, 1, out=self.sail_openness)
+        if has_keel:
+            self.keel_angle += self.keel_angle_delta * delta_time
+            np.mod(self.keel_angle, math.pi * 2, out=self.keel_angle)
+
+        self.forces = calculate_forces(self.speed_x, self.speed_y, self.sail_angle, self.sail_openness,
+                                       self.keel_angle, has_keel, self.wind_angle, self.wind_speed, self.polar)
+        self.speed_x, self.speed_y = calculate_speed(self.speed_x, self.speed_y, self.forces, delta_time)
+        self.location_x += self.speed_x * (delta_time * LOCATION_SCALE)
+        np.clip(self.location_x, BORDER_MARGIN, map_width - BORDER_MARGIN, out=self.location_x)
+        self.location_y += self.speed_y * (delta_time * LOCATION_SCALE)
+        np.clip(self.location_y, BORDER_MARGIN, map_height - BORDER_MARGIN, out=self.location_y)
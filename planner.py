@@ -0,0 +1,393 @@
+"""
+Route planning over the speed polar: the fastest way to a goal is searched with A* on a lattice of the map, where
+every move takes as long as the polar says sailing its heading takes, and changing heading takes as long as swinging
+the sail and keel to the controls of the new heading. Upwind goals are thus reached by tacking, and the map borders
+and islands are sailed around.
+Searches run a time budget at a time, so they can be spread over frames without stalling them.
+"""
+import collections
+import heapq
+import math
+import time
+
+import numpy as np
+
+from physics import BORDER_MARGIN, LOCATION_SCALE
+
+# The 8 neighbours and the knight moves, giving headings about every 22.5 degrees
+MOVES = [(1, 0), (2, 1), (1, 1), (1, 2), (0, 1), (-1, 2), (-1, 1), (-2, 1),
+         (-1, 0), (-2, -1), (-1, -1), (-1, -2), (0, -1), (1, -2), (1, -1), (2, -1)]
+MOVE_ANGLES = [math.atan2(move_y, move_x) for move_x, move_y in MOVES]
+MOVE_LENGTHS = [math.hypot(move_x, move_y) for move_x, move_y in MOVES]
+MOVES_COUNT = len(MOVES)
+EXPANSIONS_PER_CLOCK_CHECK = 16
+NODES_PER_SETUP_STEP = 256
+
+Leg = collections.namedtuple("Leg", ["start_x", "start_y", "end_x", "end_y", "heading", "sail_angle", "sail_openness",
+                                     "keel_angle", "duration"])
+
+
+class LineGoal:
+    """
+    Reached past a line across the map, like the end conditions of the lesson stages.
+    :param axis: 0 for a line of constant x, 1 for constant y
+    :param side: 1 to be reached above value, -1 below it
+    """
+    def __init__(self, axis, value, side):
+        self.axis = axis
+        self.value = value
+        self.side = side
+        self.direction = (0 if side > 0 else math.pi) if axis == 0 else side * math.pi / 2
+
+    def is_reached(self, x, y):
+        return ((x, y)[self.axis] - self.value) * self.side > 0
+
+    def is_passed(self, from_x, from_y, x, y):
+        return self.is_reached(x, y)
+
+    def distance(self, x, y):
+        return max((self.value - (x, y)[self.axis]) * self.side, 0)
+
+    def direction_from(self, x, y):
+        return self.direction
+
+
+class PointGoal:
+    """
+    Reached within reach of a point, which routes pass by instead of ending at, as it is rarely on a lattice node.
+    """
+    def __init__(self, x, y, reach):
+        self.x = x
+        self.y = y
+        self.reach = reach
+        self.direction = None
+
+    def is_reached(self, x, y):
+        return math.hypot(x - self.x, y - self.y) <= self.reach
+
+    def is_passed(self, from_x, from_y, x, y):
+        """
+        :return: whether moving from one point to the other passes within reach
+        """
+        move_x, move_y = x - from_x, y - from_y
+        length_squared = move_x ** 2 + move_y ** 2
+        along = 0 if length_squared == 0 else \
+            min(max(((self.x - from_x) * move_x + (self.y - from_y) * move_y) / length_squared, 0), 1)
+        return self.is_reached(from_x + move_x * along, from_y + move_y * along)
+
+    def distance(self, x, y):
+        return max(math.hypot(x - self.x, y - self.y) - self.reach, 0)
+
+    def direction_from(self, x, y):
+        return math.atan2(self.y - y, self.x - x)
+
+
+def vmg_speeds(speed_polar):
+    """
+    :return: the best speed made good towards every heading bin of the polar, relative to the wind, tacking if needed
+    """
+    return np.max(speed_polar.speeds * np.cos(speed_polar.headings - speed_polar.headings[:, np.newaxis]), axis=1)
+
+
+def plan_tour(speed_polar, wind_angle, start_x, start_y, points_x, points_y, max_points=None, time_budget=None):
+    """
+    Orders points to visit so the whole tour is sailed fastest, estimating every leg by the speed made good towards
+    it. Starts from the nearest neighbour tour and improves it by reversing sections of it for as long as the budget
+    allows.
+    :param max_points: only the points this many legs of the nearest neighbour tour reach are planned
+    :return: indices of the points in visiting order
+    """
+    if len(points_x) == 0:
+        return []
+    vmg = vmg_speeds(speed_polar) * LOCATION_SCALE
+    xs = np.concatenate([[start_x], points_x])
+    ys = np.concatenate([[start_y], points_y])
+
+    def leg_times_from(index, to=slice(None)):
+        offsets_x = xs[to] - xs[index]
+        offsets_y = ys[to] - ys[index]
+        with np.errstate(divide="ignore"):
+            return (np.hypot(offsets_x, offsets_y) /
+                    vmg[speed_polar.heading_index(wind_angle, np.arctan2(offsets_y, offsets_x))])
+
+    # Only the legs from the points the tour reaches are timed, as timing every pair grows with the square of the
+    # litter on the map
+    tour = []
+    is_visited = np.zeros(len(xs), dtype=bool)
+    is_visited[0] = True
+    current = 0
+    while len(tour) < len(points_x) and (max_points is None or len(tour) < max_points):
+        leg_times = leg_times_from(current)
+        leg_times[is_visited] = math.inf
+        current = int(np.argmin(leg_times))
+        is_visited[current] = True
+        tour.append(current)
+    tour_points = np.array([0] + tour)
+    leg_times = {}
+    for index in tour_points.tolist():
+        row = leg_times_from(index, tour_points)
+        row[tour_points == index] = 0
+        leg_times[index] = dict(zip(tour_points.tolist(), row.tolist()))
+
+    def tour_time(order):
+        return sum(leg_times[first][second] for first, second in zip([0] + order, order))
+
+    # Legs are not the same both ways when one of them is upwind, so every reversal is timed in full
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    best_time = tour_time(tour)
+    is_improved = True
+    while is_improved:
+        is_improved = False
+        for first in range(len(tour) - 1):
+            for last in range(first + 1, len(tour)):
+                if deadline is not None and time.perf_counter() > deadline:
+                    return [index - 1 for index in tour]
+                candidate = tour[:first] + tour[first:last + 1][::-1] + tour[last + 1:]
+                candidate_time = tour_time(candidate)
+                if candidate_time < best_time - 1e-9:
+                    tour, best_time, is_improved = candidate, candidate_time, True
+    return [index - 1 for index in tour]
+
+
+class RouteSearch:
+    """
+    A* from the boat to a goal, over lattice nodes cell_size apart starting at the boat, with the incoming heading as
+    part of the search state so heading changes can be charged for. The lattice is built by the first steps, when
+    the wind at every node is sampled once from the wind field.
+    Call step until it returns a route, or until is_done is set without one when the goal cannot be reached.
+    """
+    def __init__(self, speed_polar, stage, boat_state, boat_constants, goal, wind_field=None, wind_speed=None,
+                 game_time=0, islands=None, cell_size=65, margin_cells=8, turn_penalty=1.5):
+        """
+        :param wind_speed: the wind speed speed_polar was solved for, the stage wind speed by default
+        :param game_time: time to sample the wind field at
+        :param islands: x, y and radius arrays of the islands to keep clear of
+        :param margin_cells: how far around the boat and a point goal the lattice reaches
+        :param turn_penalty: seconds lost to every change of heading on top of swinging the controls, as the boat
+        slows down while turning and takes a while to pick up speed again
+        """
+        self.route = None
+        self.is_done = False
+        self._speed_polar = speed_polar
+        self._goal = goal
+        self._cell_size = cell_size
+        # The lattice is built by the first steps, a few nodes at a time, so no step goes over its budget
+        self._setup = self._build_lattice(stage, boat_state, boat_constants, wind_field, wind_speed, game_time,
+                                          islands, margin_cells, turn_penalty)
+
+    def _build_lattice(self, stage, boat_state, boat_constants, wind_field, wind_speed, game_time, islands,
+                       margin_cells, turn_penalty):
+        """
+        Builds the lattice and the edges of its nodes, yielding after every part that takes a while.
+        """
+        cell_size = self._cell_size
+        goal = self._goal
+        speed_polar = self._speed_polar
+        start_x, start_y = boat_state.location_x, boat_state.location_y
+
+        clearance = BORDER_MARGIN + cell_size / 2
+        low_x, high_x = clearance, stage.map_width - clearance
+        low_y, high_y = clearance, stage.map_height - clearance
+        window = margin_cells * cell_size
+        goal_x = getattr(goal, "x", start_x)
+        goal_y = getattr(goal, "y", start_y)
+        # Line goals can be reached anywhere along the line, so the lattice only stops short of them on endless maps
+        if goal.direction is None or math.isinf(stage.map_width):
+            low_x, high_x = max(low_x, min(start_x, goal_x) - window), min(high_x, max(start_x, goal_x) + window)
+        if goal.direction is None or math.isinf(stage.map_height):
+            low_y, high_y = max(low_y, min(start_y, goal_y) - window), min(high_y, max(start_y, goal_y) + window)
+        # The lattice is aligned to the boat, so the start is a node even when it is too close to a border for others
+        columns = np.arange(math.ceil((min(low_x, start_x) - start_x) / cell_size),
+                            math.floor((max(high_x, start_x) - start_x) / cell_size) + 1)
+        rows = np.arange(math.ceil((min(low_y, start_y) - start_y) / cell_size),
+                         math.floor((max(high_y, start_y) - start_y) / cell_size) + 1)
+        node_column, node_row = (grid.ravel() for grid in np.meshgrid(columns, rows, indexing="ij"))
+        self._node_x = start_x + node_column * cell_size
+        self._node_y = start_y + node_row * cell_size
+        self._start_node = int(np.flatnonzero((node_column == 0) & (node_row == 0))[0])
+        is_open = ((self._node_x >= low_x - 1e-6) & (self._node_x <= high_x + 1e-6) &
+                   (self._node_y >= low_y - 1e-6) & (self._node_y <= high_y + 1e-6))
+        nodes_count = len(self._node_x)
+        self._wind_angles = np.full(nodes_count, boat_constants.wind_angle, dtype=float)
+        speed_factors = np.ones(nodes_count)
+        move_angles = np.array(MOVE_ANGLES)
+        moves_x = np.array([move_x for move_x, _ in MOVES])
+        moves_y = np.array([move_y for _, move_y in MOVES])
+        # The edges of node n are at n * MOVES_COUNT in flat lists, as a list per node would be thousands more
+        # objects for the garbage collector to go over
+        self._targets = []
+        self._edge_times = []
+        self._bins = []
+        yield
+
+        for block_start in range(0, nodes_count, NODES_PER_SETUP_STEP):
+            block = slice(block_start, block_start + NODES_PER_SETUP_STEP)
+            node_x, node_y = self._node_x[block], self._node_y[block]
+            if wind_field is not None:
+                self._wind_angles[block], local_speeds = wind_field.sample(node_x, node_y, game_time)
+                speed_factors[block] = local_speeds / (boat_constants.wind_speed if wind_speed is None else wind_speed)
+            bins = speed_polar.heading_index(self._wind_angles[block, np.newaxis], move_angles)
+            with np.errstate(divide="ignore"):
+                edge_times = (np.array(MOVE_LENGTHS) * cell_size /
+                              (speed_polar.speeds[bins] * speed_factors[block, np.newaxis] * LOCATION_SCALE))
+            target_column = node_column[block, np.newaxis] + moves_x
+            target_row = node_row[block, np.newaxis] + moves_y
+            is_inside = ((target_column >= columns[0]) & (target_column <= columns[-1]) &
+                         (target_row >= rows[0]) & (target_row <= rows[-1]))
+            targets = np.where(is_inside, (target_column - columns[0]) * len(rows) + (target_row - rows[0]), 0)
+            is_valid = is_inside & is_open[targets] & np.isfinite(edge_times)
+            if islands is not None:
+                island_xs, island_ys, island_radii = islands
+                middle_x = (node_x[:, np.newaxis] + self._node_x[targets]) / 2
+                middle_y = (node_y[:, np.newaxis] + self._node_y[targets]) / 2
+                for island_x, island_y, island_radius in zip(island_xs, island_ys, island_radii):
+                    reach = island_radius + cell_size / 2
+                    is_valid &= np.hypot(self._node_x[targets] - island_x, self._node_y[targets] - island_y) > reach
+                    is_valid &= np.hypot(middle_x - island_x, middle_y - island_y) > reach
+            self._targets += np.where(is_valid, targets, -1).ravel().tolist()
+            self._edge_times += edge_times.ravel().tolist()
+            self._bins += bins.ravel().tolist()
+            yield
+
+        self._turn_times = (self._turn_time_table(speed_polar, stage.has_keel, boat_constants) + turn_penalty).tolist()
+        yield
+
+        start_bins = np.array(self._bins[self._start_node * MOVES_COUNT:(self._start_node + 1) * MOVES_COUNT])
+        start_wind_angle = self._wind_angles[self._start_node]
+        bin_sail_angles = np.mod(speed_polar.sail_angles[start_bins] + start_wind_angle, math.pi * 2)
+        bin_keel_angles = np.mod(speed_polar.keel_angles[start_bins] + start_wind_angle, math.pi * 2)
+        start_turn_times = np.maximum.reduce([
+            np.abs(np.mod(bin_sail_angles - boat_state.sail_angle + math.pi / 2, math.pi) - math.pi / 2) /
+            boat_constants.sail_move_speed,
+            np.abs(np.mod(bin_keel_angles - boat_state.keel_angle + math.pi / 2, math.pi) - math.pi / 2) /
+            boat_constants.keel_move_speed * stage.has_keel,
+            np.abs(speed_polar.sail_opennesses[start_bins] - boat_state.sail_openness) /
+            boat_constants.sail_open_speed])
+        # Only the speed the boat has is lost by turning away from the way it is moving
+        boat_speed = math.hypot(boat_state.speed_x, boat_state.speed_y)
+        boat_heading = math.atan2(boat_state.speed_y, boat_state.speed_x)
+        is_turning = np.abs(np.mod(move_angles - boat_heading + math.pi, math.pi * 2) - math.pi) > math.pi / 16
+        self._start_turn_times = (start_turn_times + is_turning * turn_penalty *
+                                  min(boat_speed / float(np.max(speed_polar.speeds)), 1)).tolist()
+
+        self._heuristic_speed = self._fastest_progress(self._wind_angles, speed_factors) * LOCATION_SCALE
+        self._open = [(self._heuristic(self._start_node), 0, 0.0, self._start_node, -1)]
+        self._costs = {(self._start_node, -1): 0.0}
+        self._parents = {}
+        self._pushes = 1
+
+    @staticmethod
+    def _turn_time_table(speed_polar, has_keel, boat_constants):
+        """
+        :return: seconds to swing the controls from the best ones of one polar heading to those of another, the sail
+        and keel being swung to whichever of their two ends is closer, as they push the same either way around
+        """
+        sail_angles = np.nan_to_num(speed_polar.sail_angles)
+        keel_angles = np.nan_to_num(speed_polar.keel_angles)
+        sail_opennesses = np.nan_to_num(speed_polar.sail_opennesses)
+
+        def swing(angles):
+            return np.abs(np.mod(angles - angles[:, np.newaxis] + math.pi / 2, math.pi) - math.pi / 2)
+
+        return np.maximum.reduce([swing(sail_angles) / boat_constants.sail_move_speed,
+                                  swing(keel_angles) / boat_constants.keel_move_speed * has_keel,
+                                  np.abs(sail_opennesses - sail_opennesses[:, np.newaxis]) /
+                                  boat_constants.sail_open_speed])
+
+    def _fastest_progress(self, wind_angles, speed_factors):
+        """
+        :return: an upper bound of the speed made good towards the goal, for the A* heuristic
+        """
+        polar = self._speed_polar
+        if self._goal.direction is None:
+            return float(np.max(polar.speeds)) * float(np.max(speed_factors))
+        mean_angle = math.atan2(np.mean(np.sin(wind_angles)), np.mean(np.cos(wind_angles)))
+        shifts = np.mod(wind_angles - mean_angle + math.pi, math.pi * 2) - math.pi
+        sampled_angles = mean_angle + np.linspace(np.min(shifts), np.max(shifts), 9)
+        vmg = np.max(polar.speeds * np.cos(polar.headings + sampled_angles[:, np.newaxis] - self._goal.direction))
+        return max(float(vmg), 1e-9) * float(np.max(speed_factors))
+
+    def _heuristic(self, node):
+        return self._goal.distance(self._node_x[node], self._node_y[node]) / self._heuristic_speed
+
+    def step(self, time_budget=None):
+        """
+        Builds the lattice, then expands the search, for up to time_budget seconds, or until it ends when there is no
+        budget.
+        :return: the route, a list of Legs, once found
+        """
+        if self.is_done:
+            return self.route
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        if self._setup is not None:
+            for _ in self._setup:
+                if deadline is not None and time.perf_counter() > deadline:
+                    return None
+            self._setup = None
+        open_nodes = self._open
+        costs = self._costs
+        targets, edge_times, bins, turn_times = self._targets, self._edge_times, self._bins, self._turn_times
+        expansions = 0
+        while open_nodes:
+            expansions += 1
+            if deadline is not None and expansions % EXPANSIONS_PER_CLOCK_CHECK == 0 and \
+                    time.perf_counter() > deadline:
+                return None
+            _, _, cost, node, move = heapq.heappop(open_nodes)
+            if cost > costs[(node, move)]:
+                continue
+            node_x, node_y = self._node_x[node], self._node_y[node]
+            if move < 0:
+                from_x, from_y = node_x, node_y
+            else:
+                from_x = node_x - MOVES[move][0] * self._cell_size
+                from_y = node_y - MOVES[move][1] * self._cell_size
+            if self._goal.is_passed(from_x, from_y, node_x, node_y):
+                self.route = self._build_route(node, move)
+                self.is_done = True
+                return self.route
+            edges = node * MOVES_COUNT
+            for next_move, target in enumerate(targets[edges:edges + MOVES_COUNT]):
+                if target < 0:
+                    continue
+                if move < 0:
+                    turn_time = self._start_turn_times[next_move]
+                elif move == next_move:
+                    turn_time = 0
+                else:
+                    turn_time = turn_times[bins[edges + move]][bins[edges + next_move]]
+                target_cost = cost + turn_time + edge_times[edges + next_move]
+                key = (target, next_move)
+                if target_cost < costs.get(key, math.inf):
+                    costs[key] = target_cost
+                    self._parents[key] = (node, move)
+                    self._pushes += 1
+                    heapq.heappush(open_nodes, (target_cost + self._heuristic(target), self._pushes, target_cost,
+                                                target, next_move))
+        self.is_done = True
+        return None
+
+    def _build_route(self, node, move):
+        path = []
+        key = (node, move)
+        while key[1] >= 0:
+            path.append(key)
+            key = self._parents[key]
+        path.reverse()
+
+        # Moves in a row on the same heading are merged into one leg, held for the time they take together
+        legs = []
+        leg_start = self._start_node
+        leg_start_cost = 0.0
+        for index, (node, move) in enumerate(path):
+            if index + 1 < len(path) and path[index + 1][1] == move:
+                continue
+            _, sail_angle, sail_openness, keel_angle = self._speed_polar.best(self._wind_angles[leg_start],
+                                                                              MOVE_ANGLES[move])
+            legs.append(Leg(float(self._node_x[leg_start]), float(self._node_y[leg_start]),
+                            float(self._node_x[node]), float(self._node_y[node]), MOVE_ANGLES[move],
+                            float(sail_angle), float(sail_openness), float(keel_angle),
+                            self._costs[(node, move)] - leg_start_cost))
+            leg_start = node
+            leg_start_cost = self._costs[(node, move)]
+        return legs
@@ -0,0 +1,66 @@
+import json
+import time
+
+import numpy as np
+
+
+class FrameProfiler:
+    """
+    Times methods of an object by wrapping them on the instance while enabled. Disabling removes the wrappers, so
+    the profiled code runs exactly as before and costs nothing extra. The last history_size durations of every
+    section are kept in a ring buffer.
+    """
+    def __init__(self, target, section_names, history_size=600):
+        self._target = target
+        self._section_names = section_names
+        self._history_size = history_size
+        self._durations = {name: np.zeros(history_size) for name in section_names}
+        self._counts = dict.fromkeys(section_names, 0)
+        self.is_enabled = False
+
+    def enable(self):
+        for name in self._section_names:
+            setattr(self._target, name, self._timed(name, getattr(self._target, name)))
+        self.is_enabled = True
+
+    def disable(self):
+        for name in self._section_names:
+            # Removing the instance attribute makes the class method visible again
+            delattr(self._target, name)
+        self.is_enabled = False
+
+    def toggle(self):
+        if self.is_enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def _timed(self, name, method):
+        durations = self._durations[name]
+        history_size = self._history_size
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                count = self._counts[name]
+                durations[count % history_size] = time.perf_counter() - start
+                self._counts[name] = count + 1
+        return timed
+
+    def percentiles(self):
+        """
+        :return: {section name: (p50, p95, p99)} in milliseconds, for the sections that ran at least once
+        """
+        result = {}
+        for name in self._section_names:
+            samples = self._durations[name][:min(self._counts[name], self._history_size)]
+            if len(samples):
+                result[name] = tuple(np.percentile(samples, [50, 95, 99]) * 1000)
+        return result
+
+    def dump(self, path):
+        with open(path, "w") as dump_file:
+            json.dump({name: dict(zip(["p50_ms", "p95_ms", "p99_ms"], values), samples=self._counts[name])
+                       for name, values in self.percentiles().items()}, dump_file, indent=4)
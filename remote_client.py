@@ -0,0 +1,150 @@
+"""
+Plays in a session of server.py: the boat is sailed by the server, and this window only sends it the keys and draws
+the state it sends back, interpolated between its ticks.
+Usage: python remote_client.py <host>[:<port>]
+"""
+import argparse
+import asyncio
+import math
+import threading
+
+import arcade
+
+import keys
+from default_stages import SCREEN_HEIGHT, SCREEN_WIDTH, create_stages
+from game import HelpModes
+from main import Pirates
+from network import BOAT_PREFIX, LITTER_PREFIX, ClientState, encode_message
+from physics import LOCATION_SCALE
+from replay import KEY_PRESS, KEY_RELEASE
+from server import DEFAULT_PORT
+
+CONNECT_TIMEOUT = 5
+
+
+class NetworkClient:
+    """
+    Connection to a server, served by an asyncio loop on a background thread so the window never waits on the network.
+    """
+    def __init__(self, host, port, interpolation_delay=0.1):
+        self.state = ClientState(interpolation_delay)
+        self._host = host
+        self._port = port
+        self._writer = None
+        self._connect_error = None
+        self._connected = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_until_complete, args=(self._run(),), daemon=True).start()
+        if not self._connected.wait(CONNECT_TIMEOUT):
+            raise ConnectionError("Timed out connecting to {}:{}".format(host, port))
+        if self._connect_error is not None:
+            raise self._connect_error
+
+    async def _run(self):
+        try:
+            reader, self._writer = await asyncio.open_connection(self._host, self._port)
+        except OSError as error:
+            self._connect_error = error
+            return
+        finally:
+            self._connected.set()
+        while line := await reader.readline():
+            self.state.receive(line)
+
+    def send_input(self, event, symbol, modifiers):
+        self._loop.call_soon_threadsafe(self._writer.write, encode_message([event, symbol, modifiers]))
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._writer.close)
+
+
+class RemotePirates(Pirates):
+    """
+    The game window driven by a connection instead of the local game logic. The stages are created locally, the
+    server only sends which one is played.
+    """
+    def __init__(self, width, height, connection, profile_dump_path=None):
+        super().__init__(width, height, create_stages(), profile_dump_path)
+        self._connection = connection
+        self._other_boats = {}
+        self._is_boat_seen = False
+
+    def update(self, delta_time):
+        self._game_clock.advance(delta_time)
+        game, entities = self._connection.state.sample()
+        if not game:
+            return
+        if game["stage_index"] != self._stage_index and game["stage_index"] < len(self._stages):
+            self._stage_index = game["stage_index"]
+            self._stage = self._stages[self._stage_index]
+            self._reset_speed_polar()
+            self._on_stage_loaded()
+        if game["is_started"] and not self._is_started:
+            self._on_stage_started()
+        self._is_started = game["is_started"]
+        self._is_finished = game["is_finished"]
+        if game["score"] > self._score:
+            self._last_collect_time = self._game_clock.time
+        self._score = game["score"]
+
+        own_boat = entities.pop(BOAT_PREFIX + str(self._connection.state.player_id), None)
+        if own_boat is not None:
+            self._follow_boat(own_boat, delta_time)
+        self._is_boat_seen = own_boat is not None
+        self._other_boats = {key: values for key, values in entities.items() if key.startswith(BOAT_PREFIX)}
+        self._sync_litter({int(key[len(LITTER_PREFIX):]): values for key, values in entities.items()
+                           if key.startswith(LITTER_PREFIX)})
+
+    def _follow_boat(self, boat, delta_time):
+        location_x, location_y, self._sail_angle, self._sail_openness, self._keel_angle = boat
+        # The speed is only needed for drawing the forces, so it is estimated from the movement between frames
+        if self._is_boat_seen and delta_time > 0:
+            self._speed_x = (location_x - self._location_x) / delta_time / LOCATION_SCALE
+            self._speed_y = (location_y - self._location_y) / delta_time / LOCATION_SCALE
+        self._location_x = self._draw_location_x = location_x
+        self._location_y = self._draw_location_y = location_y
+        self._calculate_speed()
+
+    def _sync_litter(self, litters):
+        for litter_id in self._litter_sprite_by_id.keys() - litters.keys():
+            self._on_litter_collected(litter_id)
+        for litter_id in litters.keys() - self._litter_sprite_by_id.keys():
+            self._on_litter_spawned(litter_id, *litters[litter_id])
+
+    def _draw_fleet(self):
+        """
+        The other players are drawn where the local game draws its AI fleet, in map coordinates.
+        """
+        for location_x, location_y, sail_angle, sail_openness, _ in self._other_boats.values():
+            arcade.draw_circle_filled(location_x, location_y, 20, arcade.color.GRAY)
+            sail_length = self._mast_length * sail_openness
+            arcade.draw_line(location_x, location_y, location_x + math.cos(sail_angle) * sail_length,
+                             location_y + math.sin(sail_angle) * sail_length, arcade.color.WHITE, 3)
+
+    def on_key_press(self, symbol: int, modifiers: int):
+        if symbol == keys.P:
+            self._toggle_profiler()
+        elif symbol == keys.H:
+            self._help_mode = HelpModes((self._help_mode.value + 1) % len(HelpModes))
+        else:
+            self._connection.send_input(KEY_PRESS, symbol, modifiers)
+
+    def on_key_release(self, symbol: int, modifiers: int):
+        self._connection.send_input(KEY_RELEASE, symbol, modifiers)
+
+    def on_close(self):
+        self._connection.close()
+        super().on_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("address", help="host[:port] of a running server.py")
+    args = parser.parse_args()
+    host, _, port = args.address.partition(":")
+    RemotePirates(SCREEN_WIDTH, SCREEN_HEIGHT, NetworkClient(host, int(port) if port else DEFAULT_PORT))
+    arcade.run()
+
+
+if __name__ == "__main__":
+    main()
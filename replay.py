@@ -0,0 +1,103 @@
+"""
+Replays sessions recorded with `python main.py --record <path>` headlessly, as fast as the CPU allows, and checks
+that they end with the same score and boat location as when they were played.
+Usage: python replay.py <recording> [<recording> ...]
+"""
+import argparse
+import json
+import math
+import sys
+
+from default_stages import create_ocean_stage, create_regatta_stage, create_stages
+from game import PiratesGame
+from stage_loader import StagePack
+
+KEY_PRESS = "press"
+KEY_RELEASE = "release"
+
+
+class InputRecorder:
+    """
+    Logs the key events of every tick together with its delta time. With the game seed, this is all that is needed
+    to run the session again.
+    """
+    def __init__(self, seed, path, regatta_size=None, stages_path=None, is_ocean=False):
+        self._seed = seed
+        self._path = path
+        self._regatta_size = regatta_size
+        self._stages_path = stages_path
+        self._is_ocean = is_ocean
+        self._ticks = []
+        self._pending_events = []
+
+    def record_key_press(self, symbol, modifiers):
+        self._pending_events.append([KEY_PRESS, symbol, modifiers])
+
+    def record_key_release(self, symbol, modifiers):
+        self._pending_events.append([KEY_RELEASE, symbol, modifiers])
+
+    def record_tick(self, delta_time):
+        self._ticks.append([delta_time, self._pending_events])
+        self._pending_events = []
+
+    def save(self, game):
+        with open(self._path, "w") as recording_file:
+            json.dump({"seed": self._seed, "regatta_size": self._regatta_size, "stages_path": self._stages_path,
+                       "is_ocean": self._is_ocean, "ticks": self._ticks, "final": game.final_state()}, recording_file)
+
+
+def replay(recording, stages):
+    """
+    :param recording: a loaded recording, as saved by InputRecorder
+    :return: final state of the replayed game
+    """
+    game = PiratesGame(stages, seed=recording["seed"])
+    for delta_time, events in recording["ticks"]:
+        for event, symbol, modifiers in events:
+            if event == KEY_PRESS:
+                game.on_key_press(symbol, modifiers)
+            else:
+                game.on_key_release(symbol, modifiers)
+        game.update(delta_time)
+    return game.final_state()
+
+
+def _replay_file(path):
+    with open(path) as recording_file:
+        recording = json.load(recording_file)
+    regatta_size = recording.get("regatta_size")
+    stages_path = recording.get("stages_path")
+    if recording.get("is_ocean"):
+        stages = [create_ocean_stage()]
+    elif regatta_size:
+        stages = [create_regatta_stage(regatta_size)]
+    else:
+        stages = StagePack(stages_path) if stages_path else create_stages()
+    return recording["final"], replay(recording, stages)
+
+
+def _is_same_state(expected, actual):
+    return all(math.isclose(expected[key], actual[key], abs_tol=1e-6) for key in expected)
+
+
+def main():
+    # Imported here, as the game imports this module for InputRecorder and multiprocessing is slow to import
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recordings", nargs="+")
+    args = parser.parse_args()
+
+    mismatches = 0
+    with ProcessPoolExecutor() as executor:
+        for path, (expected, actual) in zip(args.recordings, executor.map(_replay_file, args.recordings)):
+            if _is_same_state(expected, actual):
+                print("{}: ok, score {}".format(path, actual["score"]))
+            else:
+                mismatches += 1
+                print("{}: mismatch, expected {} got {}".format(path, expected, actual))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,12 @@
+import hashlib
 import math
 
+import numpy as np
+
 
 class Force:
+    __slots__ = ("_size", "_angle")
+
     def __init__(self, size, angle):
         self._size = size
         self._angle = angle
@@ -21,15 +26,91 @@ class Force:
 
 def drag_coef(angle):
     """
-    :param angle: attack angle
+    :param angle: attack angle, scalar or array
     :return: drag coefficient
     """
-    return 2 * (math.sin(angle) ** 4)
+    return 2 * (np.sin(angle) ** 4)
 
 
 def lift_coef(angle):
     """
-    :param angle: attack angle
+    :param angle: attack angle, scalar or array
     :return: lift coefficient
     """
-    return 2 * math.sin(angle) * math.cos(angle)
+    return 2 * np.sin(angle) * np.cos(angle)
+
+
+def scalar_coefs(angle):
+    """
+    Same curves as drag_coef and lift_coef for a single float attack angle, without numpy overhead.
+    :return: drag coefficient, lift coefficient
+    """
+    sin_angle = math.sin(angle)
+    return 2 * (sin_angle ** 4), 2 * sin_angle * math.cos(angle)
+
+
+class PolarTable:
+    """
+    Drag and lift coefficients sampled over attack angles [0, pi] with a fixed resolution and read back with linear
+    interpolation, as a faster alternative to the analytic curves or a way to use measured sail/keel polars.
+    """
+    def __init__(self, drag_curve=drag_coef, lift_curve=lift_coef, resolution=1024):
+        """
+        :param drag_curve: function of the attack angle array, giving the drag coefficients
+        :param lift_curve: function of the attack angle array, giving the lift coefficients
+        :param resolution: number of samples over [0, pi]
+        """
+        self._resolution = resolution
+        self._step = math.pi / (resolution - 1)
+        angles = np.linspace(0, math.pi, resolution)
+        # One extra sample at the end so interpolating exactly at pi does not need a bounds check
+        self._drag = np.append(drag_curve(angles), drag_curve(angles[-1:]))
+        self._lift = np.append(lift_curve(angles), lift_curve(angles[-1:]))
+        self._drag_list = self._drag.tolist()
+        self._lift_list = self._lift.tolist()
+
+    @classmethod
+    def from_points(cls, angles, drags, lifts, resolution=1024):
+        """
+        Builds a table from a measured polar, given as samples sorted by attack angle.
+        """
+        return cls(lambda table_angles: np.interp(table_angles, angles, drags),
+                   lambda table_angles: np.interp(table_angles, angles, lifts),
+                   resolution)
+
+    @classmethod
+    def load(cls, path, resolution=1024):
+        """
+        :param path: csv file with a header line and columns of attack angle (radians), drag and lift coefficients
+        """
+        angles, drags, lifts = np.loadtxt(path, delimiter=",", skiprows=1, unpack=True)
+        return cls.from_points(angles, drags, lifts, resolution)
+
+    def cache_key(self):
+        """
+        :return: a string identifying the table contents, for caching results computed with it
+        """
+        return hashlib.sha1(self._drag.tobytes() + self._lift.tobytes()).hexdigest()
+
+    def coefs(self, angle):
+        """
+        :param angle: attack angle in [0, pi], scalar or array
+        :return: drag coefficient, lift coefficient
+        """
+        position = np.clip(np.asarray(angle) / self._step, 0, self._resolution - 1)
+        index = position.astype(np.intp)
+        fraction = position - index
+        drag = self._drag[index] + (self._drag[index + 1] - self._drag[index]) * fraction
+        lift = self._lift[index] + (self._lift[index + 1] - self._lift[index]) * fraction
+        return drag, lift
+
+    def scalar_coefs(self, angle):
+        """
+        Same as coefs, without numpy overhead, for a single float attack angle.
+        """
+        position = min(max(angle / self._step, 0), self._resolution - 1)
+        index = int(position)
+        fraction = position - index
+        drag = self._drag_list[index] + (self._drag_list[index + 1] - self._drag_list[index]) * fraction
+        lift = self._lift_list[index] + (self._lift_list[index + 1] - self._lift_list[index]) * fraction
+        return drag, lift
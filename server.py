@@ -0,0 +1,234 @@
+"""
+Authoritative game server for a classroom session: every connected player sails their own game through the stage
+sequence, stepped by the server, while seeing the other players on the same stage.
+Clients only send key events, and get back the state of what is around their boat, delta-compressed.
+
+Usage:
+    python server.py [--host 0.0.0.0] [--port 8765]           serve, players join with remote_client.py host:port
+    python server.py --loopback 30 [--seconds 10]             run scripted players in process and report the costs
+"""
+import argparse
+import asyncio
+import heapq
+import math
+import random
+import time
+
+import keys
+from default_stages import SCREEN_HEIGHT, SCREEN_WIDTH, create_stages
+from game import PiratesGame
+from network import BOAT_PREFIX, LITTER_PREFIX, ClientState, decode_message, encode_delta, encode_message, \
+    quantize_boat, quantize_litter
+from replay import KEY_PRESS, KEY_RELEASE
+
+DEFAULT_PORT = 8765
+INPUT_FIELDS_COUNT = 3
+# Bytes of updates waiting for a client, beyond which it is disconnected as it is not keeping up
+MAX_CLIENT_BUFFER = 1 << 20
+
+
+class Player:
+    def __init__(self, game, send):
+        self.game = game
+        self.send = send
+        self.sent_game = {}
+        self.sent_entities = {}
+
+
+class GameServer:
+    """
+    Steps every game at tick_rate and sends each player the boats and litter inside a view around their boat.
+    Players are bucketed by stage and view sized cells every tick, so only the players around a boat are looked at
+    for its view, and at most max_boats_in_view of the closest ones are sent, so the traffic of a player stays bounded
+    however many players crowd the same place.
+    """
+    def __init__(self, stages_factory=create_stages, tick_rate=20, view_width=SCREEN_WIDTH,
+                 view_height=SCREEN_HEIGHT, max_boats_in_view=32, seed=None):
+        self._stages_factory = stages_factory
+        self._tick_interval = 1 / tick_rate
+        self._view_width = view_width
+        self._view_height = view_height
+        self._max_boats_in_view = max_boats_in_view
+        self._random = random.Random(seed)
+        self._players = {}
+        self._next_player_id = 0
+        self.tick_count = 0
+
+    @property
+    def players(self):
+        return self._players
+
+    def connect(self, send):
+        """
+        :param send: callable taking the bytes of one message for this player
+        :return: id of the new player
+        """
+        player_id = self._next_player_id
+        self._next_player_id += 1
+        game = PiratesGame(self._stages_factory(), seed=self._random.randrange(2 ** 32))
+        self._players[player_id] = Player(game, send)
+        send(encode_message({"player_id": player_id}))
+        return player_id
+
+    def disconnect(self, player_id):
+        self._players.pop(player_id, None)
+
+    def handle_input(self, player_id, event, symbol, modifiers):
+        game = self._players[player_id].game
+        if event == KEY_PRESS:
+            game.on_key_press(symbol, modifiers)
+        elif event == KEY_RELEASE:
+            game.on_key_release(symbol, modifiers)
+
+    def tick(self):
+        for player in self._players.values():
+            player.game.update(self._tick_interval)
+        self.tick_count += 1
+        self._send_updates()
+
+    def _view_cell(self, stage_index, location_x, location_y):
+        return stage_index, int(location_x // self._view_width), int(location_y // self._view_height)
+
+    def _send_updates(self):
+        boats_by_cell = {}
+        for player_id, player in self._players.items():
+            game = player.game
+            if game.is_started:
+                boat_state = game.boat_state
+                cell = self._view_cell(game.stage_index, boat_state.location_x, boat_state.location_y)
+                boats_by_cell.setdefault(cell, []).append((boat_state.location_x, boat_state.location_y,
+                                                           BOAT_PREFIX + str(player_id), quantize_boat(boat_state)))
+
+        for player_id, player in self._players.items():
+            game = player.game
+            game_fields = {"stage_index": game.stage_index, "is_started": game.is_started,
+                           "is_finished": game.is_finished, "score": game.score}
+            entities = {}
+            if game.is_started:
+                entities = self._entities_in_view(game, game.stage_index, boats_by_cell)
+            message = encode_delta(player.sent_entities, entities)
+            changed_fields = {name: value for name, value in game_fields.items()
+                              if player.sent_game.get(name) != value}
+            if changed_fields:
+                message["game"] = changed_fields
+            player.send(encode_message(message))
+            player.sent_game = game_fields
+            player.sent_entities = entities
+
+    def _entities_in_view(self, game, stage_index, boats_by_cell):
+        boat_state = game.boat_state
+        left = boat_state.location_x - self._view_width / 2
+        bottom = boat_state.location_y - self._view_height / 2
+        right = left + self._view_width
+        top = bottom + self._view_height
+        boats = []
+        _, column, row = self._view_cell(stage_index, boat_state.location_x, boat_state.location_y)
+        # The view is one cell big, so the boats inside it are all in the 3x3 cells around its center
+        for cell_column in range(column - 1, column + 2):
+            for cell_row in range(row - 1, row + 2):
+                for boat in boats_by_cell.get((stage_index, cell_column, cell_row), ()):
+                    if left < boat[0] < right and bottom < boat[1] < top:
+                        boats.append(boat)
+        if len(boats) > self._max_boats_in_view:
+            boats = heapq.nsmallest(self._max_boats_in_view, boats, key=lambda boat: math.hypot(
+                boat[0] - boat_state.location_x, boat[1] - boat_state.location_y))
+        entities = {key: values for _, _, key, values in boats}
+        for litter_id, (litter_x, litter_y) in game.litters.query_rect(left, bottom, right, top):
+            entities[LITTER_PREFIX + str(litter_id)] = quantize_litter(litter_x, litter_y)
+        return entities
+
+    async def run(self):
+        next_tick = time.perf_counter()
+        while True:
+            self.tick()
+            next_tick += self._tick_interval
+            await asyncio.sleep(max(next_tick - time.perf_counter(), 0))
+
+
+async def serve(game_server, host, port):
+    async def handle_client(reader, writer):
+        def send(data):
+            if writer.is_closing():
+                return
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                # Aborted rather than closed, as closing would wait for the buffer to be sent. This ends the reading
+                # loop below, which disconnects the player
+                writer.transport.abort()
+                return
+            writer.write(data)
+
+        player_id = game_server.connect(send)
+        try:
+            while line := await reader.readline():
+                game_server.handle_input(player_id, *decode_message(line, INPUT_FIELDS_COUNT))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            game_server.disconnect(player_id)
+            writer.close()
+
+    tcp_server = await asyncio.start_server(handle_client, host, port)
+    async with tcp_server:
+        await game_server.run()
+
+
+class LoopbackClient:
+    """
+    A client connected to a server in the same process, passing the same encoded messages without a socket.
+    """
+    def __init__(self, game_server, interpolation_delay=0.1):
+        self._game_server = game_server
+        self.state = ClientState(interpolation_delay)
+        self.player_id = game_server.connect(self.state.receive)
+
+    def send_input(self, event, symbol, modifiers):
+        self._game_server.handle_input(self.player_id, event, symbol, modifiers)
+
+    def close(self):
+        self._game_server.disconnect(self.player_id)
+
+
+def run_loopback(players_count, seconds, seed=0):
+    """
+    Runs a session of players pressing random keys as fast as possible.
+    :return: mean server tick time in seconds, mean bytes received per player per second of game
+    """
+    game_server = GameServer(seed=seed)
+    clients = [LoopbackClient(game_server) for _ in range(players_count)]
+    rng = random.Random(seed)
+    steering_keys = [keys.LEFT, keys.RIGHT, keys.UP, keys.DOWN, keys.A, keys.D]
+    for client in clients:
+        client.send_input(KEY_PRESS, keys.SPACE, 0)
+    ticks = round(seconds / game_server._tick_interval)
+    tick_time = 0
+    for _ in range(ticks):
+        for client in clients:
+            if rng.random() < 0.1:
+                client.send_input(rng.choice([KEY_PRESS, KEY_RELEASE]), rng.choice(steering_keys), 0)
+        start = time.perf_counter()
+        game_server.tick()
+        tick_time += time.perf_counter() - start
+    return tick_time / ticks, sum(client.state.bytes_received for client in clients) / players_count / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--loopback", type=int, metavar="PLAYERS", help="run scripted players instead of serving")
+    parser.add_argument("--seconds", type=float, default=10, help="game time of the loopback session")
+    args = parser.parse_args()
+
+    if args.loopback:
+        tick_time, bytes_per_second = run_loopback(args.loopback, args.seconds)
+        print("{} players: {:.3f} ms per tick, {:.0f} bytes/s per player".format(
+            args.loopback, tick_time * 1000, bytes_per_second))
+        return
+    try:
+        asyncio.run(serve(GameServer(), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
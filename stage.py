@@ -12,7 +12,11 @@ class BoatInitParams:
 
 class Stage:
     def __init__(self, map_width, map_height, boat_init_params, has_keel, has_litter, intro_text, stage_texts,
-                 end_condition, litter_spawn_rate=10):
+                 end_condition, litter_spawn_rate=10, fleet_size=0, ocean=None, wind=None):
+        """
+        :param ocean: OceanSettings making the stage an endless ocean, with infinite map_width and map_height
+        :param wind: WindSettings making the wind vary over the map and time, instead of blowing the same everywhere
+        """
         self.map_width = map_width
         self.map_height = map_height
         self.boat_init_params = boat_init_params
@@ -22,3 +26,6 @@ class Stage:
         self.stage_texts = stage_texts
         self.end_condition = end_condition
         self.litter_spawn_rate = litter_spawn_rate
+        self.fleet_size = fleet_size
+        self.ocean = ocean
+        self.wind = wind
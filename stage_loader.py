@@ -0,0 +1,159 @@
+"""
+Stage packs: lessons described in a json file (or toml, on Python 3.11 and up) instead of code, like
+stages/lessons.json.
+
+{
+    "right_to_left": true,                  texts are reversed line by line, see heb
+    "stages": [
+        {
+            "map_width": 5200, "map_height": 375,
+            "boat": {"location_x": 130, "location_y": 187.5, "sail_openness": 1, "sail_angle": 0, "keel_angle": 180},
+            "has_keel": false, "has_litter": false, "litter_spawn_rate": 10,
+            "intro_text": ["line", "line"],
+            "texts": [{"text": "line or lines", "x": -130, "y": 431.25, "size": 20, "multiline": true, "width": 650}],
+            "end_condition": "end_of_horizontal_stage",
+            "wind": {"gust": 0.3, "shift": 20, "cell_size": 650, "keyframe_interval": 20}     optional, see WindSettings
+        }
+    ]
+}
+
+Angles are in degrees, end conditions are names from game.END_CONDITIONS, and any other text field is passed to
+arcade.Text. A pack is parsed once into a binary cache file holding every stage separately, so loading it later only
+reads the index, and each stage is only read when the game gets to it.
+"""
+import hashlib
+import json
+import math
+import os
+import pickle
+import struct
+import zlib
+
+from game import END_CONDITIONS
+from onscreen_text import OnscreenText, heb
+from stage import BoatInitParams, Stage
+from wind import WindSettings
+
+LOADER_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+_CACHE_MAGIC = b"PSTG"
+_HEADER = struct.Struct("<4sI")
+_OFFSET = struct.Struct("<Q")
+
+
+def _read_pack(path):
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as pack_file:
+            return tomllib.load(pack_file)
+    with open(path, encoding="utf-8") as pack_file:
+        return json.load(pack_file)
+
+
+def _lines(text):
+    return [text] if isinstance(text, str) else text
+
+
+def _parse_stage(spec, right_to_left):
+    """
+    :return: the stage as plain values, with everything derived from the file already computed
+    """
+    def as_text(text):
+        return heb(*_lines(text)) if right_to_left else "\n".join(_lines(text))
+
+    if spec["end_condition"] not in END_CONDITIONS:
+        raise ValueError("Unknown end condition {!r}, expected one of {}".format(spec["end_condition"],
+                                                                                 sorted(END_CONDITIONS)))
+    boat = spec["boat"]
+    wind = spec.get("wind")
+    if wind is not None:
+        wind = dict(wind)
+        if "shift" in wind:
+            wind["shift"] = math.radians(wind["shift"])
+    texts = []
+    for text_spec in spec.get("texts", []):
+        options = {name: tuple(value) if isinstance(value, list) else value for name, value in text_spec.items()
+                   if name not in ("text", "x", "y", "size")}
+        texts.append((as_text(text_spec["text"]), text_spec["x"], text_spec["y"], text_spec["size"], options))
+    return {
+        "map_width": spec["map_width"],
+        "map_height": spec["map_height"],
+        "boat": (boat["location_x"], boat["location_y"], boat.get("sail_openness", 1),
+                 math.radians(boat.get("sail_angle", 0)), math.radians(boat.get("keel_angle", 180))),
+        "has_keel": spec["has_keel"],
+        "has_litter": spec["has_litter"],
+        "intro_text": as_text(spec["intro_text"]),
+        "texts": texts,
+        "end_condition": spec["end_condition"],
+        "litter_spawn_rate": spec.get("litter_spawn_rate", 10),
+        "fleet_size": spec.get("fleet_size", 0),
+        "wind": wind,
+    }
+
+
+def _build_stage(parsed):
+    wind = WindSettings(**parsed["wind"]) if parsed["wind"] is not None else None
+    return Stage(parsed["map_width"], parsed["map_height"], BoatInitParams(*parsed["boat"]), parsed["has_keel"],
+                 parsed["has_litter"], parsed["intro_text"],
+                 [OnscreenText(text, x, y, size, **options) for text, x, y, size, options in parsed["texts"]],
+                 END_CONDITIONS[parsed["end_condition"]], parsed["litter_spawn_rate"], parsed["fleet_size"],
+                 wind=wind)
+
+
+def _cache_path(path, cache_dir):
+    status = os.stat(path)
+    key = json.dumps([os.path.abspath(path), status.st_mtime_ns, status.st_size, LOADER_VERSION])
+    return os.path.join(cache_dir, "stages_{}.bin".format(hashlib.sha1(key.encode()).hexdigest()))
+
+
+def _write_cache(cache_path, parsed_stages):
+    """
+    Layout: magic, stage count, stage count + 1 offsets, then one compressed pickle per stage between its offsets.
+    """
+    blobs = [zlib.compress(pickle.dumps(parsed, pickle.HIGHEST_PROTOCOL)) for parsed in parsed_stages]
+    offset = _HEADER.size + _OFFSET.size * (len(blobs) + 1)
+    offsets = [offset]
+    for blob in blobs:
+        offset += len(blob)
+        offsets.append(offset)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # Written aside and renamed, so processes loading the same pack at once never see half a file
+    temporary_path = "{}.{}.tmp".format(cache_path, os.getpid())
+    with open(temporary_path, "wb") as cache_file:
+        cache_file.write(_HEADER.pack(_CACHE_MAGIC, len(blobs)))
+        cache_file.write(b"".join(_OFFSET.pack(offset) for offset in offsets))
+        cache_file.write(b"".join(blobs))
+    os.replace(temporary_path, cache_path)
+
+
+class StagePack:
+    """
+    The stages of a pack file as a lazy sequence: a stage is read from the cache and built the first time it is
+    indexed, which the game does when it advances to it.
+    """
+    def __init__(self, path, cache_dir=DEFAULT_CACHE_DIR):
+        self._cache_path = _cache_path(path, cache_dir)
+        if not os.path.exists(self._cache_path):
+            pack = _read_pack(path)
+            right_to_left = pack.get("right_to_left", False)
+            _write_cache(self._cache_path, [_parse_stage(spec, right_to_left) for spec in pack["stages"]])
+        with open(self._cache_path, "rb") as cache_file:
+            magic, stages_count = _HEADER.unpack(cache_file.read(_HEADER.size))
+            if magic != _CACHE_MAGIC:
+                raise ValueError("{} is not a stage cache file".format(self._cache_path))
+            self._offsets = [_OFFSET.unpack(cache_file.read(_OFFSET.size))[0] for _ in range(stages_count + 1)]
+        self._stages = [None] * stages_count
+
+    def __len__(self):
+        return len(self._stages)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = range(len(self._stages))[index]
+        if self._stages[index] is None:
+            with open(self._cache_path, "rb") as cache_file:
+                cache_file.seek(self._offsets[index])
+                blob = cache_file.read(self._offsets[index + 1] - self._offsets[index])
+            self._stages[index] = _build_stage(pickle.loads(zlib.decompress(blob)))
+        return self._stages[index]
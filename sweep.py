@@ -0,0 +1,157 @@
+"""
+Runs a controller on every combination of stage and boat parameters in a sweep file, over all cores, and
+reports per configuration the time to reach the stage end condition, the score rate and the failure rate.
+Every finished run is appended to the results csv right away, and runs already in it are skipped, so an interrupted
+sweep can be continued by running it again.
+
+Usage: python sweep.py <sweep.json> [--output sweep.csv] [--jobs N] [--timeout SECONDS]
+
+The sweep file looks like:
+{
+    "stages": [3, 7],
+    "seeds": 5,
+    "timeout": 300,
+    "controller": "autopilot",              optional, "greedy" by default
+    "parameters": {"litter_spawn_rate": [1.5, 7], "wind_speed": [30, 50]}
+}
+Stage parameters are map_width, map_height, litter_spawn_rate, has_keel, has_litter, fleet_size and the boat init params
+location_x, location_y, sail_openness, sail_angel, keel_angel. Boat parameters are wind_speed, sail_move_speed,
+sail_open_speed and keel_move_speed, and physics_hz sets how finely the same boat is simulated.
+"""
+import argparse
+import copy
+import csv
+import itertools
+import json
+import os
+import statistics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import keys
+from controllers import AutopilotController, GreedyController
+from default_stages import create_stages
+from game import PiratesGame
+
+STAGE_PARAMETERS = {"map_width", "map_height", "litter_spawn_rate", "has_keel", "has_litter", "fleet_size"}
+BOAT_INIT_PARAMETERS = {"location_x", "location_y", "sail_openness", "sail_angel", "keel_angel"}
+GAME_PARAMETERS = {"wind_speed", "sail_move_speed", "sail_open_speed", "keel_move_speed", "physics_hz"}
+RESULT_FIELDS = ["configuration", "seed", "reached_end", "time", "score", "score_rate"]
+# The autopilot finishes every search at once, so runs do not depend on how fast the machine is
+CONTROLLERS = {"greedy": GreedyController, "autopilot": lambda: AutopilotController(time_budget=None)}
+
+
+def build_stage(stage_number, parameters):
+    stage = copy.copy(create_stages()[stage_number - 1])
+    stage.boat_init_params = copy.copy(stage.boat_init_params)
+    for name, value in parameters.items():
+        if name in STAGE_PARAMETERS:
+            setattr(stage, name, value)
+        elif name in BOAT_INIT_PARAMETERS:
+            setattr(stage.boat_init_params, name, value)
+        elif name not in GAME_PARAMETERS and name not in ("stage", "controller"):
+            raise ValueError("Unknown sweep parameter: {}".format(name))
+    return stage
+
+
+def run_episode(configuration, seed, timeout):
+    """
+    Sails one stage with the controller until the end condition is met or the timeout (in game seconds) passes.
+    """
+    stage = build_stage(configuration["stage"], configuration)
+    game_options = {name: value for name, value in configuration.items() if name in GAME_PARAMETERS}
+    game = PiratesGame([stage], seed=seed, **game_options)
+    controller = CONTROLLERS[configuration["controller"]]()
+    game.on_key_press(keys.SPACE, 0)
+    while not game.is_finished and game.time < timeout:
+        controller.control(game)
+        game.update(game.physics_step_time)
+    return {
+        "configuration": json.dumps(configuration, sort_keys=True),
+        "seed": seed,
+        "reached_end": game.is_finished,
+        "time": game.time,
+        "score": game.score,
+        # A run may end before any game time has passed
+        "score_rate": game.score / game.time if game.time else 0.0,
+    }
+
+
+def configurations(sweep):
+    names = sorted(sweep.get("parameters", {}))
+    for stage_number in sweep["stages"]:
+        for values in itertools.product(*(sweep["parameters"][name] for name in names)):
+            yield dict(zip(names, values), stage=stage_number, controller=sweep.get("controller", "greedy"))
+
+
+def _read_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="") as results_file:
+        return list(csv.DictReader(results_file))
+
+
+def run_sweep(sweep, output_path, jobs=None):
+    done = {(row["configuration"], int(row["seed"])) for row in _read_results(output_path)}
+    runs = [(configuration, seed) for configuration in configurations(sweep) for seed in range(sweep.get("seeds", 1))
+            if (json.dumps(configuration, sort_keys=True), seed) not in done]
+
+    is_new_file = not os.path.exists(output_path)
+    with open(output_path, "a", newline="") as results_file, ProcessPoolExecutor(jobs) as executor:
+        writer = csv.DictWriter(results_file, RESULT_FIELDS)
+        if is_new_file:
+            writer.writeheader()
+        futures = [executor.submit(run_episode, configuration, seed, sweep.get("timeout", 300))
+                   for configuration, seed in runs]
+        try:
+            for future in as_completed(futures):
+                writer.writerow(future.result())
+                results_file.flush()
+        except KeyboardInterrupt:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+
+def summarize(output_path):
+    runs_by_configuration = {}
+    for row in _read_results(output_path):
+        runs_by_configuration.setdefault(row["configuration"], []).append(row)
+
+    for configuration, runs in sorted(runs_by_configuration.items()):
+        successes = [run for run in runs if run["reached_end"] == "True"]
+        times = [float(run["time"]) for run in successes]
+        print("{}: runs {}, failure rate {:.0%}, time to end {}, score rate {:.1f}/s".format(
+            configuration, len(runs), 1 - len(successes) / len(runs),
+            "{:.1f}s".format(statistics.mean(times)) if times else "-",
+            statistics.mean(float(run["score_rate"]) for run in runs)))
+
+
+def _positive_seconds(text):
+    seconds = float(text)
+    if not seconds > 0:
+        raise argparse.ArgumentTypeError("must be more than 0 seconds")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sweep")
+    parser.add_argument("--output", default="sweep.csv")
+    parser.add_argument("--jobs", type=int, default=None, help="number of processes, all cores by default")
+    parser.add_argument("--timeout", type=_positive_seconds, default=None,
+                        help="game seconds per run, instead of the timeout of the sweep file")
+    args = parser.parse_args()
+
+    with open(args.sweep) as sweep_file:
+        sweep = json.load(sweep_file)
+    if args.timeout is not None:
+        sweep["timeout"] = args.timeout
+    elif not sweep.get("timeout", 300) > 0:
+        parser.error("the timeout of {} must be more than 0 seconds".format(args.sweep))
+    try:
+        run_sweep(sweep, args.output, args.jobs)
+    finally:
+        summarize(args.output)
+
+
+if __name__ == "__main__":
+    main()
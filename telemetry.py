@@ -0,0 +1,275 @@
+"""
+Session telemetry: the boat state and forces of every physics step, and the stage and litter events, streamed to a
+compressed columnar file while playing with `python main.py --telemetry <path>`.
+Usage: python telemetry.py <telemetry file>     prints a summary of every stage of the session
+
+File layout: magic, version, length prefixed json metadata (column names, event kinds and the session options),
+then chunks of a single table each: table index, rows count, and per column its compressed length and bytes.
+Every column is float64, byte shuffled before compression so the similar high bytes of neighbouring values are
+packed together. A session cut short leaves at most a partial last chunk, which the reader ignores.
+"""
+import argparse
+import json
+import math
+import mmap
+import queue
+import struct
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+from telemetry_events import EVENT_KINDS
+
+TELEMETRY_VERSION = 1
+_MAGIC = b"PTLM"
+_HEADER = struct.Struct("<4sII")
+_CHUNK_HEADER = struct.Struct("<BI")
+_COLUMN_LENGTH = struct.Struct("<I")
+
+# The forces are stored in cartesian form like BoatForces keeps them, Force.from_cartesian gives the polar form
+TICK_COLUMNS = ["time", "stage_index", "score", "location_x", "location_y", "speed_x", "speed_y", "sail_angle",
+                "sail_openness", "keel_angle", "wind_angle", "wind_speed", "wind_drag_x", "wind_drag_y",
+                "wind_lift_x", "wind_lift_y", "water_drag_x", "water_drag_y", "water_lift_x", "water_lift_y"]
+EVENT_COLUMNS = ["time", "kind", "subject_id", "x", "y"]
+TABLES = ["ticks", "events"]
+
+
+def _shuffle(column):
+    return column.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def _unshuffle(data):
+    return np.frombuffer(data, dtype=np.uint8).reshape(8, -1).T.copy().view(np.float64).ravel()
+
+
+class _RingTable:
+    """
+    Rows written by the game thread and read by the writer thread. Rows are counted from the start of the session,
+    a row living at its count modulo the capacity, and are only overwritten after the writer has flushed them.
+    """
+    def __init__(self, columns, capacity, chunk_rows):
+        self.rows = np.zeros((capacity, len(columns)))
+        self.capacity = capacity
+        self.chunk_rows = chunk_rows
+        self.written_count = 0
+        self.queued_count = 0
+        self.flushed_count = 0
+        self.dropped_count = 0
+
+
+class TelemetryRecorder:
+    """
+    Records into preallocated ring buffers, which costs the game thread a single row copy per tick. Every
+    chunk_rows rows are handed to a background thread that compresses and writes them, so the game never waits
+    for the disk. If the disk falls a whole ring behind, new rows are dropped and counted instead of blocking.
+    """
+    def __init__(self, path, metadata=None, capacity=16384, chunk_rows=1024, event_capacity=4096,
+                 event_chunk_rows=256, compression_level=6):
+        self._file = open(path, "wb")
+        header = json.dumps({"tables": {"ticks": TICK_COLUMNS, "events": EVENT_COLUMNS}, "event_kinds": EVENT_KINDS,
+                             "metadata": metadata or {}}).encode()
+        self._file.write(_HEADER.pack(_MAGIC, TELEMETRY_VERSION, len(header)) + header)
+        self._tables = [_RingTable(TICK_COLUMNS, capacity, chunk_rows),
+                        _RingTable(EVENT_COLUMNS, event_capacity, event_chunk_rows)]
+        self._compression_level = compression_level
+        self._queue = queue.Queue()
+        self._error = None
+        self._writer = threading.Thread(target=self._write_chunks, name="telemetry writer", daemon=True)
+        self._writer.start()
+
+    @property
+    def dropped_ticks(self):
+        return self._tables[0].dropped_count
+
+    def _append(self, table_index, row):
+        table = self._tables[table_index]
+        if table.written_count - table.flushed_count == table.capacity:
+            table.dropped_count += 1
+            return
+        table.rows[table.written_count % table.capacity] = row
+        table.written_count += 1
+        if table.written_count - table.queued_count == table.chunk_rows:
+            self._queue_rows(table_index)
+
+    def _queue_rows(self, table_index):
+        table = self._tables[table_index]
+        if table.written_count > table.queued_count:
+            self._queue.put((table_index, table.queued_count, table.written_count))
+            table.queued_count = table.written_count
+
+    def record_tick(self, time, stage_index, score, location_x, location_y, speed_x, speed_y, sail_angle,
+                    sail_openness, keel_angle, wind_angle, wind_speed, forces):
+        """
+        :param forces: BoatForces of the tick
+        """
+        self._append(0, (time, stage_index, score, location_x, location_y, speed_x, speed_y, sail_angle,
+                         sail_openness, keel_angle, wind_angle, wind_speed, forces.wind_drag_x, forces.wind_drag_y,
+                         forces.wind_lift_x, forces.wind_lift_y, forces.water_drag_x, forces.water_drag_y,
+                         forces.water_lift_x, forces.water_lift_y))
+
+    def record_event(self, kind, time, subject_id, x=math.nan, y=math.nan):
+        """
+        :param kind: one of the event kind constants, like LITTER_COLLECTED
+        :param subject_id: the stage index of stage events, the litter id of litter events
+        """
+        self._append(1, (time, kind, subject_id, x, y))
+
+    def flush(self):
+        """
+        Hands the rows not written yet to the writer, without waiting for it.
+        """
+        for table_index in range(len(self._tables)):
+            self._queue_rows(table_index)
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
+
+    def _write_chunks(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            table_index, start, end = item
+            table = self._tables[table_index]
+            # take copies the rows, so the game may reuse their place in the ring while they are compressed
+            rows = table.rows.take(np.arange(start, end) % table.capacity, axis=0)
+            table.flushed_count = end
+            if self._error is None:
+                try:
+                    self._write_chunk(table_index, rows)
+                except OSError as error:
+                    # Kept for close to raise, as the game thread never waits on the writer
+                    self._error = error
+
+    def _write_chunk(self, table_index, rows):
+        parts = [_CHUNK_HEADER.pack(table_index, len(rows))]
+        for column in rows.T:
+            compressed = zlib.compress(_shuffle(np.ascontiguousarray(column)), self._compression_level)
+            parts += [_COLUMN_LENGTH.pack(len(compressed)), compressed]
+        self._file.write(b"".join(parts))
+        self._file.flush()
+
+
+class TelemetryReader:
+    """
+    Maps a telemetry file into memory and indexes its chunks, decompressing only the columns that are read.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as telemetry_file:
+            self._map = mmap.mmap(telemetry_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise ValueError("{} is not a telemetry file".format(path))
+        if version != TELEMETRY_VERSION:
+            raise ValueError("{} is of telemetry version {}, expected {}".format(path, version, TELEMETRY_VERSION))
+        header = json.loads(self._map[_HEADER.size:_HEADER.size + header_length])
+        self._columns = header["tables"]
+        self.event_kinds = header["event_kinds"]
+        self.metadata = header["metadata"]
+        self._chunks = {table: [] for table in TABLES}
+        self._index_chunks(_HEADER.size + header_length)
+
+    def _index_chunks(self, offset):
+        """
+        Finds the (offset, length) of every column of every complete chunk.
+        """
+        size = len(self._map)
+        while offset + _CHUNK_HEADER.size <= size:
+            table_index, rows_count = _CHUNK_HEADER.unpack_from(self._map, offset)
+            offset += _CHUNK_HEADER.size
+            table = TABLES[table_index]
+            columns = []
+            for _ in self._columns[table]:
+                if offset + _COLUMN_LENGTH.size > size:
+                    return
+                length, = _COLUMN_LENGTH.unpack_from(self._map, offset)
+                offset += _COLUMN_LENGTH.size
+                if offset + length > size:
+                    return
+                columns.append((offset, length))
+                offset += length
+            self._chunks[table].append((rows_count, columns))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def columns(self, table):
+        return self._columns[table]
+
+    def __len__(self):
+        return sum(rows_count for rows_count, _ in self._chunks["ticks"])
+
+    def read(self, table, columns=None):
+        """
+        :param table: "ticks" or "events"
+        :param columns: names of the columns to read, all of them if None
+        :return: {column name: array of its values in recording order}
+        """
+        names = self._columns[table] if columns is None else columns
+        result = {}
+        with memoryview(self._map) as view:
+            for name in names:
+                column_index = self._columns[table].index(name)
+                parts = []
+                for _, chunk_columns in self._chunks[table]:
+                    offset, length = chunk_columns[column_index]
+                    parts.append(_unshuffle(zlib.decompress(view[offset:offset + length])))
+                result[name] = np.concatenate(parts) if parts else np.zeros(0)
+        return result
+
+    def ticks(self, columns=None):
+        return self.read("ticks", columns)
+
+    def events(self):
+        return self.read("events")
+
+
+def summarize(reader):
+    """
+    :return: a line per stage played, with its duration, distance sailed, top speed and litter collected
+    """
+    ticks = reader.ticks(["time", "stage_index", "location_x", "location_y", "speed_x", "speed_y"])
+    events = reader.events()
+    collected_kind = reader.event_kinds.index("litter_collected")
+    lines = []
+    # A stage may be played more than once, so stages are split where the stage index changes
+    boundaries = np.flatnonzero(np.diff(ticks["stage_index"])) + 1
+    for start, end in zip(np.concatenate([[0], boundaries]), np.concatenate([boundaries, [len(ticks["time"])]])):
+        if start == end:
+            continue
+        times = ticks["time"][start:end]
+        distance = np.hypot(np.diff(ticks["location_x"][start:end]), np.diff(ticks["location_y"][start:end])).sum()
+        top_speed = np.hypot(ticks["speed_x"][start:end], ticks["speed_y"][start:end]).max()
+        collected = np.count_nonzero((events["kind"] == collected_kind) & (events["time"] >= times[0]) &
+                                     (events["time"] <= times[-1]))
+        lines.append("stage {}: {:.1f}s, sailed {:.0f}, top speed {:.1f}, collected {}".format(
+            int(ticks["stage_index"][start]) + 1, times[-1] - times[0], distance, top_speed, collected))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    args = parser.parse_args()
+    with TelemetryReader(args.path) as reader:
+        print("{} ticks, {} events, {}".format(len(reader), len(reader.events()["time"]), reader.metadata))
+        for line in summarize(reader):
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
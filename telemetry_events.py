@@ -0,0 +1,11 @@
+"""
+Kinds of the events recorded to telemetry, apart from the recorder so the game can name them without importing it.
+"""
+STAGE_STARTED = 0
+STAGE_ENDED = 1
+LITTER_SPAWNED = 2
+LITTER_COLLECTED = 3
+LITTER_TAKEN = 4
+LITTER_DESPAWNED = 5
+EVENT_KINDS = ["stage_started", "stage_ended", "litter_spawned", "litter_collected", "litter_taken",
+               "litter_despawned"]
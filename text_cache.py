@@ -0,0 +1,33 @@
+import arcade
+
+
+class TextCache:
+    """
+    Keeps one laid out arcade.Text per string and style, so drawing a text that did not change only moves it.
+    """
+    def __init__(self):
+        self._texts = {}
+
+    def prepare(self, text, x, y, color=arcade.color.WHITE, font_size=12, **kwargs):
+        """
+        Lays the text out ahead of drawing it, which is the slow part.
+        :return: the arcade.Text at (x, y), None for an empty text
+        """
+        if not text:
+            return None
+        key = (text, color, font_size, tuple(sorted(kwargs.items())))
+        text_object = self._texts.get(key)
+        if text_object is None:
+            text_object = arcade.Text(text, x, y, color, font_size, **kwargs)
+            self._texts[key] = text_object
+        elif text_object.position != (x, y):
+            text_object.position = (x, y)
+        return text_object
+
+    def draw(self, text, x, y, color=arcade.color.WHITE, font_size=12, **kwargs):
+        text_object = self.prepare(text, x, y, color, font_size, **kwargs)
+        if text_object is not None:
+            text_object.draw()
+
+    def clear(self):
+        self._texts.clear()
@@ -0,0 +1,185 @@
+"""
+Velocity prediction: the best steady-state speed of the boat for every heading relative to the wind, together with
+the sail angle, sail openness and keel angle that reach it.
+Run from the repository root to build the cache and print the polar: python vpp.py
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from physics import FORCE_SCALE, FRICTION_SCALE, calculate_forces, calculate_speed
+
+VPP_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+_prefetch_executor = None
+_prefetched = {}
+
+
+class SpeedPolar:
+    """
+    All the angles are kept relative to the wind angle, as the physics only depend on the angles between the wind,
+    the sail, the keel and the boat movement. Headings that cannot be sailed have a speed of 0 and NaN controls.
+    """
+    def __init__(self, headings, speeds, sail_angles, sail_opennesses, keel_angles):
+        self.headings = headings
+        self.speeds = speeds
+        self.sail_angles = sail_angles
+        self.sail_opennesses = sail_opennesses
+        self.keel_angles = keel_angles
+        self._heading_step = math.pi * 2 / len(headings)
+
+    @classmethod
+    def solve(cls, wind_speed=50, polar=None, has_keel=True, heading_count=72, sail_angle_count=72,
+              sail_openness_count=4, keel_angle_count=72, max_iterations=1000, tolerance=1e-3):
+        """
+        Finds the steady-state velocity of every combination of sail angle, sail openness and keel angle at once, by
+        iterating the speed update of all of them as one array until it stops changing, then keeps the fastest
+        combination for every heading.
+        :param has_keel: False for the boat of stages without a keel, which only sails the headings the wind pushes
+        it to
+        """
+        if not has_keel:
+            # The keel angle makes no difference without a keel, so a single one is tried
+            keel_angle_count = 1
+        sail_angles, sail_opennesses, keel_angles = (grid.ravel() for grid in np.meshgrid(
+            np.linspace(0, math.pi * 2, sail_angle_count, endpoint=False),
+            np.linspace(1, 0, sail_openness_count, endpoint=False),
+            np.linspace(0, math.pi * 2, keel_angle_count, endpoint=False), indexing="ij"))
+        speed_x = np.zeros(len(sail_angles))
+        speed_y = np.zeros(len(sail_angles))
+        is_converged = np.zeros(len(sail_angles), dtype=bool)
+        # Only the combinations that have not settled yet are iterated, so the work shrinks as they converge
+        active = np.arange(len(sail_angles))
+        for _ in range(max_iterations):
+            forces = calculate_forces(speed_x[active], speed_y[active], sail_angles[active],
+                                      sail_opennesses[active], keel_angles[active], has_keel, 0, wind_speed, polar)
+            new_speed_x, new_speed_y = calculate_speed(speed_x[active], speed_y[active], forces)
+            change = np.hypot(new_speed_x - speed_x[active], new_speed_y - speed_y[active])
+            speed_x[active], speed_y[active] = new_speed_x, new_speed_y
+            is_converged[active] = change < tolerance
+            active = active[~is_converged[active]]
+            if len(active) == 0:
+                break
+
+        speeds = np.where(is_converged, np.hypot(speed_x, speed_y), 0)
+        heading_bins = \
+            np.round(np.arctan2(speed_y, speed_x) / (math.pi * 2 / heading_count)).astype(int) % heading_count
+        # Sorted by heading bin and then by speed, the fastest combination of every bin is the last one of it
+        order = np.lexsort((speeds, heading_bins))
+        sorted_bins = heading_bins[order]
+        last_of_bin = np.append(np.nonzero(np.diff(sorted_bins))[0], len(order) - 1)
+        best = np.zeros(heading_count, dtype=int)
+        best[sorted_bins[last_of_bin]] = order[last_of_bin]
+        best_speeds = np.zeros(heading_count)
+        best_speeds[sorted_bins[last_of_bin]] = speeds[order[last_of_bin]]
+        is_reachable = best_speeds > 0
+
+        def best_of(values):
+            return np.where(is_reachable, values[best], np.nan)
+
+        headings = np.arange(heading_count) * (math.pi * 2 / heading_count)
+        return cls(headings, best_speeds, best_of(sail_angles), best_of(sail_opennesses), best_of(keel_angles))
+
+    @classmethod
+    def load_or_solve(cls, cache_dir=DEFAULT_CACHE_DIR, **solve_options):
+        """
+        Solves the polar only once for every set of physics constants, keeping it in cache_dir.
+        """
+        path = os.path.join(cache_dir, "vpp_{}.npz".format(cls._cache_key(**solve_options)))
+        if os.path.exists(path):
+            return cls.load(path)
+        speed_polar = cls.solve(**solve_options)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Saved aside and renamed, so a polar solved on a prefetch thread or another process is never read half written
+        temporary_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(temporary_path, "wb") as polar_file:
+            speed_polar.save(polar_file)
+        os.replace(temporary_path, path)
+        return speed_polar
+
+    @classmethod
+    def prefetch(cls, cache_dir=DEFAULT_CACHE_DIR, **solve_options):
+        """
+        Starts load_or_solve on a background thread, once per process for the same options, so a polar needed later
+        is ready by then even on a cold cache.
+        :return: a concurrent.futures.Future of the SpeedPolar
+        """
+        global _prefetch_executor
+        key = (cache_dir, cls._cache_key(**solve_options))
+        if key not in _prefetched:
+            if _prefetch_executor is None:
+                # A single worker, as solving is numpy bound and polars are rarely needed at once
+                _prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speed polar")
+            _prefetched[key] = _prefetch_executor.submit(cls.load_or_solve, cache_dir, **solve_options)
+        return _prefetched[key]
+
+    @staticmethod
+    def _cache_key(polar=None, has_keel=True, **solve_options):
+        key = dict(solve_options, version=VPP_VERSION, force_scale=FORCE_SCALE, friction_scale=FRICTION_SCALE,
+                   polar=None if polar is None else polar.cache_key(), has_keel=has_keel)
+        return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays["headings"], arrays["speeds"], arrays["sail_angles"], arrays["sail_opennesses"],
+                       arrays["keel_angles"])
+
+    def save(self, path):
+        """
+        :param path: file name or open binary file
+        """
+        np.savez(path, headings=self.headings, speeds=self.speeds, sail_angles=self.sail_angles,
+                 sail_opennesses=self.sail_opennesses, keel_angles=self.keel_angles)
+
+    def heading_index(self, wind_angle, heading):
+        return np.round(np.mod(np.asarray(heading) - wind_angle, math.pi * 2) / self._heading_step).astype(int) % \
+               len(self.headings)
+
+    def best(self, wind_angle, heading):
+        """
+        :param wind_angle: scalar or array
+        :param heading: scalar or array
+        :return: speed, sail angle, sail openness, keel angle - the angles absolute like the boat ones
+        """
+        index = self.heading_index(wind_angle, heading)
+        return (self.speeds[index], np.mod(self.sail_angles[index] + wind_angle, math.pi * 2),
+                self.sail_opennesses[index], np.mod(self.keel_angles[index] + wind_angle, math.pi * 2))
+
+    def best_vmg_heading(self, wind_angle, direction):
+        """
+        The heading that makes the most progress towards direction, which is direction itself unless it is too close
+        to the wind, in which case it is the closest tack.
+        :param wind_angle: scalar or array
+        :param direction: scalar or array
+        """
+        wind_angle, direction = np.broadcast_arrays(wind_angle, direction)
+        headings = self.headings + wind_angle[..., np.newaxis]
+        velocities_made_good = self.speeds * np.cos(headings - direction[..., np.newaxis])
+        best = np.argmax(velocities_made_good, axis=-1)
+        return np.take_along_axis(headings, best[..., np.newaxis], axis=-1)[..., 0]
+
+    def speed_table(self, wind_angles, headings):
+        """
+        :return: best speeds, one row per wind angle and one column per heading
+        """
+        return self.speeds[self.heading_index(np.asarray(wind_angles)[:, np.newaxis], np.asarray(headings))]
+
+
+def main():
+    speed_polar = SpeedPolar.load_or_solve()
+    for heading, speed, sail_angle, sail_openness, keel_angle in zip(
+            speed_polar.headings, speed_polar.speeds, speed_polar.sail_angles, speed_polar.sail_opennesses,
+            speed_polar.keel_angles):
+        print("heading {:5.0f}: speed {:5.1f}, sail {:5.0f}, openness {:.2f}, keel {:5.0f}".format(
+            math.degrees(heading), speed, math.degrees(sail_angle), sail_openness, math.degrees(keel_angle)))
+
+
+if __name__ == "__main__":
+    main()
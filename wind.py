@@ -0,0 +1,156 @@
+import collections
+import math
+
+import numpy as np
+
+_HASH_MULTIPLIERS = [np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9),
+                     np.uint64(0xD6E8FEB86659FD93)]
+
+
+def _hash_uniform(seed, *coordinates):
+    """
+    Random numbers in [0, 1) that only depend on the seed and the integer coordinates, so any grid node gets the same
+    value whichever tile it is generated with.
+    """
+    value = np.full(np.broadcast(*coordinates).shape, seed, dtype=np.uint64)
+    for coordinate, multiplier in zip(coordinates, _HASH_MULTIPLIERS):
+        value ^= np.asarray(coordinate, dtype=np.int64).astype(np.uint64) * multiplier
+        # splitmix64 finalizer
+        value ^= value >> np.uint64(30)
+        value *= np.uint64(0xBF58476D1CE4E5B9)
+        value ^= value >> np.uint64(27)
+        value *= np.uint64(0x94D049BB133111EB)
+        value ^= value >> np.uint64(31)
+    return (value >> np.uint64(11)).astype(np.float64) / (1 << 53)
+
+
+def _bilinear(nodes, node_x, node_y, fraction_x, fraction_y):
+    return ((nodes[node_x][node_y] * (1 - fraction_x) + nodes[node_x + 1][node_y] * fraction_x) * (1 - fraction_y) +
+            (nodes[node_x][node_y + 1] * (1 - fraction_x) + nodes[node_x + 1][node_y + 1] * fraction_x) * fraction_y)
+
+
+class WindSettings:
+    """
+    Makes the wind of a stage vary over the map, and over time unless keyframe_interval is None.
+    :param gust: largest change of the wind speed, as a fraction of the stage wind speed
+    :param shift: largest turn of the wind angle, in radians
+    """
+    def __init__(self, gust=0.3, shift=math.radians(20), cell_size=650, keyframe_interval=20, tile_size=16,
+                 max_tiles=64):
+        self.gust = gust
+        self.shift = shift
+        self.cell_size = cell_size
+        self.keyframe_interval = keyframe_interval
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+
+
+class WindField:
+    """
+    Random gusts and shifts on the nodes of a grid of cell_size, keyframed every keyframe_interval seconds, blended
+    bilinearly between the nodes and linearly between the keyframes. Nodes are generated in square tiles of
+    tile_size cells, the max_tiles last used of which are kept, so sampling around the boats only looks values up.
+    Wind is blended as a vector, so shifts turn smoothly through any angle.
+    """
+    def __init__(self, settings, seed, base_angle, base_speed):
+        self._settings = settings
+        self._seed = seed
+        self._base_angle = base_angle
+        self._base_speed = base_speed
+        self._tiles = collections.OrderedDict()
+
+    def _tile(self, tile_x, tile_y, keyframe):
+        """
+        :return: wind x and y of the (tile_size + 1) ** 2 nodes of the tile, as an array and as nested lists
+        """
+        key = (tile_x, tile_y, keyframe)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile
+        tile_size = self._settings.tile_size
+        # One more node on each axis, shared with the next tile, so every cell is inside a single tile
+        nodes_x, nodes_y = np.meshgrid(np.arange(tile_x * tile_size, (tile_x + 1) * tile_size + 1),
+                                       np.arange(tile_y * tile_size, (tile_y + 1) * tile_size + 1), indexing="ij")
+        speed = self._base_speed * (1 + self._settings.gust * (
+            2 * _hash_uniform(self._seed, nodes_x, nodes_y, keyframe, 0) - 1))
+        angle = self._base_angle + self._settings.shift * (
+            2 * _hash_uniform(self._seed, nodes_x, nodes_y, keyframe, 1) - 1)
+        wind = np.stack([speed * np.cos(angle), speed * np.sin(angle)])
+        tile = (wind, wind.tolist())
+        self._tiles[key] = tile
+        if len(self._tiles) > self._settings.max_tiles:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def _keyframes(self, time):
+        """
+        :return: (keyframe, weight) pairs to blend for this time
+        """
+        if self._settings.keyframe_interval is None:
+            return [(0, 1)]
+        keyframe_time = time / self._settings.keyframe_interval
+        keyframe = math.floor(keyframe_time)
+        fraction = keyframe_time - keyframe
+        return [(keyframe, 1 - fraction), (keyframe + 1, fraction)]
+
+    def sample(self, x, y, time):
+        """
+        :param x: array of map locations
+        :param y: array of map locations
+        :param time: game time, the same for all the locations
+        :return: wind angles and wind speeds at the locations
+        """
+        tile_size = self._settings.tile_size
+        grid_x = np.asarray(x, dtype=float) / self._settings.cell_size
+        grid_y = np.asarray(y, dtype=float) / self._settings.cell_size
+        column = np.floor(grid_x).astype(np.int64)
+        row = np.floor(grid_y).astype(np.int64)
+        fraction_x = grid_x - column
+        fraction_y = grid_y - row
+        tile_x = column // tile_size
+        tile_y = row // tile_size
+        # Tiles are found by a single integer key per location, as np.unique over rows is far slower
+        tile_keys, tile_index = np.unique((tile_x << 32) + (tile_y + (1 << 31)), return_inverse=True)
+        nodes_per_row = tile_size + 1
+        nodes_per_tile = nodes_per_row ** 2
+        # Flat index of the bottom left corner node of every location into the stacked tiles
+        corner = (tile_index.reshape(column.shape) * 2 * nodes_per_tile +
+                  (column - tile_x * tile_size) * nodes_per_row + (row - tile_y * tile_size))
+        corners = [(corner, (1 - fraction_x) * (1 - fraction_y)),
+                   (corner + nodes_per_row, fraction_x * (1 - fraction_y)),
+                   (corner + 1, (1 - fraction_x) * fraction_y),
+                   (corner + nodes_per_row + 1, fraction_x * fraction_y)]
+
+        wind_x = wind_y = 0
+        for keyframe, weight in self._keyframes(time):
+            nodes = np.concatenate([
+                self._tile(tile_key >> 32, (tile_key & 0xFFFFFFFF) - (1 << 31), keyframe)[0].ravel()
+                for tile_key in tile_keys.tolist()])
+            for index, corner_weight in corners:
+                wind_x = wind_x + nodes.take(index) * (corner_weight * weight)
+                wind_y = wind_y + nodes.take(index + nodes_per_tile) * (corner_weight * weight)
+        return np.arctan2(wind_y, wind_x), np.hypot(wind_x, wind_y)
+
+    def sample_scalar(self, x, y, time):
+        """
+        The same as sample for a single location, in plain python as it is called every physics step.
+        """
+        tile_size = self._settings.tile_size
+        grid_x = x / self._settings.cell_size
+        grid_y = y / self._settings.cell_size
+        column = math.floor(grid_x)
+        row = math.floor(grid_y)
+        fraction_x = grid_x - column
+        fraction_y = grid_y - row
+        tile_x = column // tile_size
+        tile_y = row // tile_size
+        node_x = column - tile_x * tile_size
+        node_y = row - tile_y * tile_size
+
+        wind_x = wind_y = 0
+        for keyframe, weight in self._keyframes(time):
+            nodes_x, nodes_y = self._tile(tile_x, tile_y, keyframe)[1]
+            wind_x += weight * _bilinear(nodes_x, node_x, node_y, fraction_x, fraction_y)
+            wind_y += weight * _bilinear(nodes_y, node_x, node_y, fraction_x, fraction_y)
+        return math.atan2(wind_y, wind_x), math.hypot(wind_x, wind_y)